@@ -0,0 +1,215 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 18:31:00
+@Description: Extract promoter sequences of GFF3 genes directly from an indexed genome, replacing promoter_extract.sh.
+@filename : promoter_extract.py
+"""
+
+import argparse
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+"""
+python3 promoter_extract.py -g all.gff3 -f all.chrs.con -w 1000:0 -o promoters.fa
+python3 promoter_extract.py -g all.gff3 -f all.chrs.con -w 1000:0 2000:0 2000:500 -p 8 -o promoters.fa
+
+Each window UP:DOWN is taken relative to the transcription start site of every
+gene feature: UP bases upstream and DOWN bases downstream of the TSS, on the
+gene's strand. Minus-strand promoters are reverse complemented, and windows are
+clipped at chromosome ends. 1000:0 gives the same regions as
+`bedtools flank -l 1000 -r 0 -s` in promoter_extract.sh.
+
+The genome is read through its samtools-compatible .fai index (built here if
+missing or older than the FASTA) and a memory map, so only the bytes of each
+promoter are touched. Chromosomes are processed in parallel. With one window
+the output goes to -o; with several, each window gets its own file named like
+promoters.1000up_0down.fa.
+"""
+
+COMPLEMENT = str.maketrans('ACGTRYMKBDHVNacgtrymkbdhvn', 'TGCAYRKMVHDBNtgcayrkmvhdbn')
+
+
+def parse_window(text):
+    up, _, down = text.partition(':')
+    try:
+        up, down = int(up), int(down or 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid window '{text}', expected UP:DOWN such as 1000:0")
+    if up < 0 or down < 0 or up + down == 0:
+        raise argparse.ArgumentTypeError(f"invalid window '{text}', UP and DOWN must be >= 0 and not both 0")
+    return up, down
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Extract promoter sequences of GFF3 genes from a genome FASTA.')
+    parser.add_argument('-g', '--gff', type=str, required=True, help='Input GFF3 annotation')
+    parser.add_argument('-f', '--fasta', type=str, required=True, help='Genome FASTA (uncompressed)')
+    parser.add_argument('-w', '--windows', type=parse_window, nargs='+', default=[(1000, 0)],
+                        help='Windows as UP:DOWN bases around the TSS (default: 1000:0)')
+    parser.add_argument('-o', '--output', type=str, default='promoters.fa', help='Output FASTA (default: promoters.fa)')
+    parser.add_argument('-t', '--feature', type=str, default='gene', help='GFF3 feature type to use (default: gene)')
+    parser.add_argument('-n', '--name_attr', type=str, default='ID',
+                        help='GFF3 attribute used as sequence name (default: ID)')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of chromosomes processed in parallel')
+    return parser.parse_args()
+
+
+def build_fai(fasta_path, fai_path):
+    """Write a samtools faidx compatible index: name, length, offset, linebases, linewidth.
+
+    Like samtools, every line of a sequence except the last must have the same
+    length, otherwise offsets computed from the index would point at the wrong bases.
+    """
+    entries = []
+    name = None
+    with open(fasta_path, 'rb') as f:
+        pos = 0
+        for line in f:
+            if line.startswith(b'>'):
+                if name is not None:
+                    entries.append((name, length, offset, linebases, linewidth))
+                name = line[1:].split()[0].decode()
+                length, offset, linebases, linewidth, ended = 0, pos + len(line), 0, 0, False
+            elif name is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if bases and (ended or bases > linebases > 0 or (bases == linebases and len(line) != linewidth)):
+                    raise ValueError(f"{fasta_path}: sequence {name} has lines of different lengths "
+                                     f"(byte {pos}); rewrap it with a fixed line width before indexing")
+                if linebases == 0:
+                    linebases, linewidth = bases, len(line)
+                elif bases < linebases:
+                    ended = True
+                length += bases
+            pos += len(line)
+        if name is not None:
+            entries.append((name, length, offset, linebases, linewidth))
+    with open(fai_path + '.tmp', 'w') as out:
+        out.writelines('\t'.join(map(str, entry)) + '\n' for entry in entries)
+    os.replace(fai_path + '.tmp', fai_path)
+
+
+def read_fai(fasta_path):
+    """Return {name: (length, offset, linebases, linewidth)}, (re)building the .fai when needed."""
+    fai_path = fasta_path + '.fai'
+    if not os.path.exists(fai_path) or os.path.getmtime(fai_path) < os.path.getmtime(fasta_path):
+        print(f"Indexing {fasta_path}...")
+        build_fai(fasta_path, fai_path)
+    index = OrderedDict()
+    with open(fai_path) as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.split('\t')[:5]
+            index[name] = (int(length), int(offset), int(linebases), int(linewidth))
+    return index
+
+
+def fetch(mm, entry, start, end):
+    """Bases [start, end) of one sequence, read straight from the memory-mapped FASTA."""
+    length, offset, linebases, linewidth = entry
+    if end <= start:
+        return ''
+    first = offset + (start // linebases) * linewidth + start % linebases
+    last = offset + ((end - 1) // linebases) * linewidth + (end - 1) % linebases
+    return mm[first:last + 1].replace(b'\n', b'').replace(b'\r', b'').decode()
+
+
+def parse_attributes(text):
+    attrs = {}
+    for item in text.strip().split(';'):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            attrs[key.strip()] = unquote(value.strip())
+    return attrs
+
+
+def iter_genes(gff_path, feature='gene', name_attr='ID'):
+    """Yield (seqid, start, end, strand, name) for features of exactly the given type, 0-based half-open."""
+    with open(gff_path) as f:
+        for line in f:
+            if line.startswith('##FASTA'):
+                break
+            if line.startswith('#') or not line.strip():
+                continue
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 9 or cols[2] != feature:
+                continue
+            name = parse_attributes(cols[8]).get(name_attr)
+            if name is None:
+                continue
+            yield cols[0], int(cols[3]) - 1, int(cols[4]), cols[6], name
+
+
+def promoter_region(start, end, strand, up, down, chrom_length):
+    """Window around the TSS clipped to the chromosome; returns (start, end, reverse)."""
+    if strand == '-':
+        region = (end - down, end + up)
+    else:
+        region = (start - up, start + down)
+    return max(0, region[0]), min(chrom_length, region[1]), strand == '-'
+
+
+def extract_chromosome(task):
+    """Worker: promoter FASTA records of all genes on one chromosome, one string per window."""
+    fasta_path, entry, genes, windows = task
+    outputs = [[] for _ in windows]
+    with open(fasta_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end, strand, name in genes:
+            for i, (up, down) in enumerate(windows):
+                region_start, region_end, reverse = promoter_region(start, end, strand, up, down, entry[0])
+                seq = fetch(mm, entry, region_start, region_end)
+                if not seq:
+                    continue
+                if reverse:
+                    seq = seq.translate(COMPLEMENT)[::-1]
+                outputs[i].append(f">{name}\n{seq}\n")
+    return [''.join(records) for records in outputs]
+
+
+def window_output_path(output, window, n_windows):
+    if n_windows == 1:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}.{window[0]}up_{window[1]}down{ext or '.fa'}"
+
+
+def main():
+    args = parse_args()
+    index = read_fai(args.fasta)
+
+    genes_by_chrom = OrderedDict()
+    n_missing = 0
+    for seqid, start, end, strand, name in iter_genes(args.gff, args.feature, args.name_attr):
+        if seqid not in index:
+            n_missing += 1
+            continue
+        genes_by_chrom.setdefault(seqid, []).append((start, end, strand, name))
+    n_genes = sum(len(genes) for genes in genes_by_chrom.values())
+    print(f"Loaded {n_genes} {args.feature} features on {len(genes_by_chrom)} sequences.")
+    if n_missing:
+        print(f"Skipped {n_missing} features on sequences missing from {args.fasta}.")
+
+    tasks = [(args.fasta, index[seqid], genes, args.windows) for seqid, genes in genes_by_chrom.items()]
+    paths = [window_output_path(args.output, window, len(args.windows)) for window in args.windows]
+    handles = [open(path, 'w') for path in paths]
+    try:
+        if args.processes > 1:
+            with ProcessPoolExecutor(max_workers=args.processes) as executor:
+                results = executor.map(extract_chromosome, tasks)
+                for chunks in results:
+                    for handle, chunk in zip(handles, chunks):
+                        handle.write(chunk)
+        else:
+            for task in tasks:
+                for handle, chunk in zip(handles, extract_chromosome(task)):
+                    handle.write(chunk)
+    finally:
+        for handle in handles:
+            handle.close()
+    for path in paths:
+        print(f"Saved {path}")
+
+
+if __name__ == '__main__':
+    main()
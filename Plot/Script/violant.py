@@ -1,40 +1,19 @@
-# 导入pandas库
-import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
+import os
+import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'RNA-Seq', 'Scripts'))
+from filter_statistic import sweep_thresholds, sweep_count_lists
 
-# 定义函数
-def process_data(filename, im_threshold, coor_threshold, output_dir="groups"):
-    # 读取文件，使用制表符分隔
-    df = pd.read_csv(filename, sep="\t")
-    # 按照TF列分组
-    groups = df.groupby("TF")
-    # 初始化三个列表，用于存储每一次统计的结果
-    count_list1 = []
-    count_list2 = []
-    count_list3 = []
-    # 遍历每一组
-    for name, group in groups:
-        # 统计每一组的数据个数，并添加到第一个列表中
-        count1 = len(group)
-        count_list1.append(count1)
-        # 过滤掉IM列小于阈值的数据，并统计每一组的数据个数，并添加到第二个列表中
-        group = group[group["IM"] > im_threshold]
-        count2 = len(group)
-        count_list2.append(count2)
-        # 过滤掉Coor列小于阈值的数据，并统计每一组的数据个数，并添加到第三个列表中
-        group = group[group["Coor"] > coor_threshold]
-        count3 = len(group)
-        count_list3.append(count3)
-        # 将每一组的数据写入到指定目录下的文本文件中
-        # output_path = os.path.join(output_dir, f"{name}.txt")
-        # with open(output_path, "w") as f:
-        #     f.write("\n".join(group["Gene"]) + "\n")
-    # 返回三个列表
-    return count_list1, count_list2, count_list3
+
+# 定义函数：一次读取网络文件，使用filter_statistic.sweep_thresholds向量化统计
+def process_data(filename, im_threshold, coor_threshold):
+    table = sweep_thresholds(filename, [im_threshold], [coor_threshold])
+    # 返回三个列表：每个TF的总边数、IM过滤后边数、IM和Coor过滤后边数
+    return sweep_count_lists(table, im_threshold, coor_threshold)
 
 
 # %%
@@ -0,0 +1,154 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 15:00:00
+@Description: Benjamini-Hochberg q-values for tables too large to hold in memory.
+@filename : bh_fdr.py
+"""
+
+import argparse
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+"""
+python3 bh_fdr.py -p [p值列名] -q [q值列名] [spearman_output.tsv] [输出文件名]
+
+The q-value of an edge depends only on its p-value and on how many p-values are
+not larger, so the table is processed in three streaming passes:
+    1. p-values are read in chunks, sorted and spilled to disk as sorted runs;
+    2. the runs are merged into one sorted memory-mapped array and the step-up
+       minimum is taken from the largest p-value downwards;
+    3. the table is read again and each p-value is looked up in the sorted array.
+Missing p-values get a missing q-value and do not count towards the number of tests.
+"""
+
+DEFAULT_CHUNK_ROWS = 1000000
+
+
+def bh_qvalues(pvalues):
+    """In-memory Benjamini-Hochberg q-values, equivalent to R p.adjust(method='BH')."""
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    qvalues = np.full(pvalues.shape, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    m = len(p)
+    if m == 0:
+        return qvalues
+    order = np.argsort(p, kind='stable')
+    scaled = p[order] * m / np.arange(1, m + 1)
+    q = np.minimum.accumulate(scaled[::-1])[::-1]
+    out = np.empty(m)
+    out[order] = np.minimum(q, 1.0)
+    qvalues[valid] = out
+    return qvalues
+
+
+def _spill_sorted_runs(in_file, pvalue_column, chunk_rows, tmp_dir, sep):
+    runs = []
+    m = 0
+    reader = pd.read_csv(in_file, sep=sep, usecols=[pvalue_column], chunksize=chunk_rows,
+                         float_precision='round_trip')
+    for i, chunk in enumerate(reader):
+        p = chunk[pvalue_column].to_numpy(dtype=np.float64)
+        p = np.sort(p[~np.isnan(p)])
+        if len(p) == 0:
+            continue
+        path = os.path.join(tmp_dir, f"run_{i:06d}.npy")
+        np.save(path, p)
+        runs.append(path)
+        m += len(p)
+    return runs, m
+
+
+def _merge_runs(runs, out, memory_rows):
+    """K-way merge of sorted .npy runs into the memory-mapped array `out`.
+
+    Each step reads one block from every unfinished run; blocks are sized so that
+    all of them together hold at most `memory_rows` values.
+    """
+    arrays = [np.load(path, mmap_mode='r') for path in runs]
+    block_rows = max(1, memory_rows // max(1, len(arrays)))
+    pos = [0] * len(arrays)
+    written = 0
+    while True:
+        blocks = [(k, arr[pos[k]:pos[k] + block_rows]) for k, arr in enumerate(arrays) if pos[k] < len(arr)]
+        if not blocks:
+            break
+        # Every value <= bound is known to come before anything still unread
+        bound = min((block[-1] for k, block in blocks if pos[k] + len(block) < len(arrays[k])), default=np.inf)
+        parts = []
+        for k, block in blocks:
+            n = np.searchsorted(block, bound, side='right')
+            parts.append(block[:n])
+            pos[k] += n
+        merged = np.sort(np.concatenate(parts), kind='stable')
+        out[written:written + len(merged)] = merged
+        written += len(merged)
+
+
+def _step_up_qvalues(sorted_p, out, block_rows):
+    """Fill `out` with q-values aligned to `sorted_p`, walking blocks from the end."""
+    m = len(sorted_p)
+    running = np.inf
+    for end in range(m, 0, -block_rows):
+        start = max(0, end - block_rows)
+        scaled = sorted_p[start:end] * m / np.arange(start + 1, end + 1)
+        q = np.minimum.accumulate(np.append(scaled, running)[::-1])[::-1][:-1]
+        out[start:end] = np.minimum(q, 1.0)
+        running = q[0]
+
+
+def external_bh(in_file, out_file, pvalue_column='PValue', qvalue_column='QValue',
+                chunk_rows=DEFAULT_CHUNK_ROWS, sep='\t', tmp_dir=None):
+    """Append a Benjamini-Hochberg q-value column to `in_file` using bounded memory."""
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        runs, m = _spill_sorted_runs(in_file, pvalue_column, chunk_rows, work_dir, sep)
+        sorted_p = np.lib.format.open_memmap(os.path.join(work_dir, 'sorted_p.npy'), mode='w+',
+                                             dtype=np.float64, shape=(m,))
+        sorted_q = np.lib.format.open_memmap(os.path.join(work_dir, 'sorted_q.npy'), mode='w+',
+                                             dtype=np.float64, shape=(m,))
+        _merge_runs(runs, sorted_p, chunk_rows)
+        _step_up_qvalues(sorted_p, sorted_q, chunk_rows)
+        for path in runs:
+            os.remove(path)
+
+        first = True
+        for chunk in pd.read_csv(in_file, sep=sep, chunksize=chunk_rows, float_precision='round_trip'):
+            p = chunk[pvalue_column].to_numpy(dtype=np.float64)
+            q = np.full(len(p), np.nan)
+            valid = ~np.isnan(p)
+            if m:
+                q[valid] = sorted_q[np.searchsorted(sorted_p, p[valid], side='left')]
+            chunk[qvalue_column] = q
+            chunk.to_csv(out_file, sep=sep, index=False, mode='w' if first else 'a', header=first)
+            first = False
+        if first:
+            header = pd.read_csv(in_file, sep=sep, nrows=0)
+            header[qvalue_column] = []
+            header.to_csv(out_file, sep=sep, index=False)
+        del sorted_p, sorted_q
+    return m
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Append Benjamini-Hochberg q-values to a large delimited table.')
+    parser.add_argument('-p', '--pvalue-column', type=str, default='PValue', help='p-value column (default: PValue)')
+    parser.add_argument('-q', '--qvalue-column', type=str, default='QValue', help='q-value column (default: QValue)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'rows read per chunk (default: {DEFAULT_CHUNK_ROWS})')
+    parser.add_argument('--tmp-dir', type=str, default=None, help='directory for temporary sorted runs')
+    parser.add_argument('in_file', type=str, help='input table (TSV)')
+    parser.add_argument('out_file', type=str, help='output table (TSV)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    m = external_bh(args.in_file, args.out_file, args.pvalue_column, args.qvalue_column,
+                    chunk_rows=args.chunk_rows, tmp_dir=args.tmp_dir)
+    print(f"{m} p-values adjusted, saved to {args.out_file}")
+
+
+if __name__ == '__main__':
+    main()
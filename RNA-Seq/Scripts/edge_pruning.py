@@ -0,0 +1,78 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 18:28:00
+@Description: Keep only the strongest GRNBoost2 edges of each TF with a bounded heap per TF.
+@filename : edge_pruning.py
+"""
+
+import heapq
+import itertools
+import pandas as pd
+
+"""
+Edges can be fed in any number of chunks (one GRNBoost2 result, checkpoint
+partitions or shards). Each chunk is first cut by --min-im and reduced to its
+own top-k per TF with a vectorized sort, so only at most k edges per TF and
+chunk reach the heaps. Memory is bounded by k x number of TFs, whatever the
+size of the input. Ties in importance keep the edge that was seen first.
+"""
+
+
+class TopKPerTF:
+    """Streaming per-TF top-k / minimum-importance filter for GRNBoost2 edges."""
+
+    def __init__(self, top_k=None, min_importance=None, columns=('TF', 'target', 'importance')):
+        self.top_k = top_k
+        self.min_importance = min_importance
+        self.tf_col, self.target_col, self.importance_col = columns
+        self.heaps = {}
+        self.kept = []
+        self.counter = itertools.count()
+        self.n_seen = 0
+
+    def add(self, network):
+        """Feed one chunk of edges."""
+        self.n_seen += len(network)
+        if self.min_importance is not None:
+            network = network[network[self.importance_col] >= self.min_importance]
+        if self.top_k is None:
+            self.kept.append(network[[self.tf_col, self.target_col, self.importance_col]])
+            return
+        network = network.sort_values(self.importance_col, ascending=False, kind='stable')
+        network = network.groupby(self.tf_col, sort=False).head(self.top_k)
+        for tf, target, importance in zip(network[self.tf_col], network[self.target_col],
+                                          network[self.importance_col]):
+            heap = self.heaps.setdefault(tf, [])
+            item = (importance, -next(self.counter), target)
+            if len(heap) < self.top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def result(self):
+        """Kept edges as a DataFrame sorted by decreasing importance, as grnboost2 returns them."""
+        columns = [self.tf_col, self.target_col, self.importance_col]
+        if self.top_k is None:
+            network = pd.concat(self.kept, ignore_index=True) if self.kept else pd.DataFrame(columns=columns)
+            return network.sort_values(self.importance_col, ascending=False, kind='stable').reset_index(drop=True)
+        rows = [(tf, target, importance, -order)
+                for tf, heap in self.heaps.items() for importance, order, target in heap]
+        network = pd.DataFrame(rows, columns=columns + ['_order'])
+        network = network.sort_values([self.importance_col, '_order'], ascending=[False, True], kind='stable')
+        return network[columns].reset_index(drop=True)
+
+
+def add_pruning_args(parser):
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='Keep only the k most important targets of each TF before the Spearman stage')
+    parser.add_argument('--min-im', type=float, default=None,
+                        help='Keep only edges with GRNBoost2 importance >= this value before the Spearman stage')
+
+
+def prune_network(network, top_k=None, min_importance=None):
+    """Apply per-TF top-k and/or minimum importance pruning to an in-memory network."""
+    if top_k is None and min_importance is None:
+        return network
+    pruner = TopKPerTF(top_k, min_importance)
+    pruner.add(network)
+    return pruner.result()
@@ -0,0 +1,130 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 18:00:00
+@Description: Binary float32 cache of expression matrices, loaded zero-copy through a memory map.
+@filename : expression_cache.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+"""
+python3 expression_cache.py [msu_fpkm_expression.csv]
+
+The cache of expr.csv is two files next to it (or in --cache-dir):
+    expr.csv.cache.npy   float32 matrix, genes x samples, C order
+    expr.csv.cache.json  gene and sample names plus the size, mtime and sha1 of expr.csv
+The cache is reused while the CSV is unchanged. When the size or mtime differs
+the sha1 is recomputed, and the cache is rebuilt only if the content changed.
+"""
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def cache_paths(csv_path, cache_dir=None):
+    prefix = os.path.join(cache_dir or os.path.dirname(os.path.abspath(csv_path)),
+                          os.path.basename(csv_path) + '.cache')
+    return prefix + '.npy', prefix + '.json'
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def source_stat(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _write_json_atomic(data, path):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def build_cache(csv_path, cache_dir=None):
+    """Parse the expression CSV once and store it as a float32 matrix plus a name index."""
+    npy_path, meta_path = cache_paths(csv_path, cache_dir)
+    stat = source_stat(csv_path)
+    df = pd.read_csv(csv_path, index_col=0)
+    matrix = np.lib.format.open_memmap(npy_path + '.tmp', mode='w+', dtype=np.float32, shape=df.shape)
+    matrix[:] = df.to_numpy(dtype=np.float32)
+    matrix.flush()
+    del matrix
+    os.replace(npy_path + '.tmp', npy_path)
+    meta = {
+        'genes': [str(x) for x in df.index],
+        'samples': [str(x) for x in df.columns],
+        'source': dict(stat, sha1=file_sha1(csv_path)),
+    }
+    _write_json_atomic(meta, meta_path)
+    return meta
+
+
+def ensure_cache(csv_path, cache_dir=None):
+    """Return the cache metadata of `csv_path`, rebuilding the cache if the CSV changed."""
+    npy_path, meta_path = cache_paths(csv_path, cache_dir)
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return build_cache(csv_path, cache_dir)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = source_stat(csv_path)
+    source = meta['source']
+    if source['size'] == stat['size'] and source['mtime_ns'] == stat['mtime_ns']:
+        return meta
+    if source['size'] == stat['size'] and source['sha1'] == file_sha1(csv_path):
+        # Touched but unchanged, remember the new mtime so the hash is not recomputed next time
+        meta['source'].update(stat)
+        _write_json_atomic(meta, meta_path)
+        return meta
+    return build_cache(csv_path, cache_dir)
+
+
+def load_expression(csv_path, orientation='genes', cache_dir=None):
+    """Load an expression matrix through its binary cache without copying the data.
+
+    orientation='genes' gives genes x samples (as pd.read_csv(..., index_col=0));
+    orientation='samples' gives the transposed samples x genes view GRNBoost2 expects.
+    """
+    if orientation not in ('genes', 'samples'):
+        raise ValueError(f"orientation must be 'genes' or 'samples', not {orientation!r}")
+    meta = ensure_cache(csv_path, cache_dir)
+    npy_path, _ = cache_paths(csv_path, cache_dir)
+    matrix = np.load(npy_path, mmap_mode='r')
+    df = pd.DataFrame(matrix, index=pd.Index(meta['genes']), columns=pd.Index(meta['samples']), copy=False)
+    return df if orientation == 'genes' else df.T
+
+
+def read_expression(csv_path, orientation='genes', use_cache=False, cache_dir=None):
+    """Read an expression CSV directly, or through the binary cache when `use_cache` is set."""
+    if use_cache:
+        return load_expression(csv_path, orientation, cache_dir)
+    df = pd.read_csv(csv_path, index_col=0)
+    return df if orientation == 'genes' else df.T
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert expression matrices (CSV) into the binary cache.')
+    parser.add_argument('--cache-dir', type=str, default=None, help='directory for cache files (default: next to CSV)')
+    parser.add_argument('csv_files', type=str, nargs='+', help='expression matrix files, genes x samples')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for csv_path in args.csv_files:
+        meta = ensure_cache(csv_path, args.cache_dir)
+        print(f"{csv_path}: {len(meta['genes'])} genes x {len(meta['samples'])} samples -> "
+              f"{cache_paths(csv_path, args.cache_dir)[0]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 # 导入pandas库
+import numpy as np
 import pandas as pd
 import os
+import contextlib
+from regulon_store import RegulonStoreWriter
 
 # 定义函数
-def process_data(filename, im_threshold, coor_threshold, output_dir="groups"):
+def process_data(filename, im_threshold, coor_threshold, output_dir="groups", store_path=None):
     # 读取文件，使用制表符分隔
     df = pd.read_csv(filename, sep="\t")
     # 按照TF列分组
@@ -12,27 +15,83 @@ def process_data(filename, im_threshold, coor_threshold, output_dir="groups"):
     count_list1 = []
     count_list2 = []
     count_list3 = []
-    # 遍历每一组
-    for name, group in groups:
-        # 统计每一组的数据个数，并添加到第一个列表中
-        count1 = len(group)
-        count_list1.append(count1)
-        # 过滤掉IM列小于阈值的数据，并统计每一组的数据个数，并添加到第二个列表中
-        group = group[group["IM"] > im_threshold]
-        count2 = len(group)
-        count_list2.append(count2)
-        # 过滤掉Coor列小于阈值的数据，并统计每一组的数据个数，并添加到第三个列表中
-        group = group[group["Coor"] > coor_threshold]
-        count3 = len(group)
-        count_list3.append(count3)
-        # 将每一组的数据写入到指定目录下的文本文件中
-        output_path = os.path.join(output_dir, f"{name}.txt")
-        with open(output_path, "w") as f:
-            f.write("\n".join(group["Gene"]) + "\n")
+    # 指定store_path时写入单文件regulon存储，否则每个TF写一个文件；出错时由上下文管理器关闭并删除未完成的存储
+    with (RegulonStoreWriter(store_path) if store_path else contextlib.nullcontext()) as writer:
+        # 遍历每一组
+        for name, group in groups:
+            # 统计每一组的数据个数，并添加到第一个列表中
+            count1 = len(group)
+            count_list1.append(count1)
+            # 过滤掉IM列小于阈值的数据，并统计每一组的数据个数，并添加到第二个列表中
+            group = group[group["IM"] > im_threshold]
+            count2 = len(group)
+            count_list2.append(count2)
+            # 过滤掉Coor列小于阈值的数据，并统计每一组的数据个数，并添加到第三个列表中
+            group = group[group["Coor"] > coor_threshold]
+            count3 = len(group)
+            count_list3.append(count3)
+            # 将每一组的数据写入到regulon存储或指定目录下的文本文件中
+            if writer is not None:
+                writer.add(f"{name}", group["Gene"])
+                continue
+            output_path = os.path.join(output_dir, f"{name}.txt")
+            with open(output_path, "w") as f:
+                f.write("\n".join(group["Gene"]) + "\n")
     # 返回三个列表
     return count_list1, count_list2, count_list3
 
 
+# 一次读取网络文件，统计多组IM/Coor阈值组合下每个TF保留的靶基因数
+def sweep_thresholds(filename, im_thresholds, coor_thresholds):
+    # 只读取需要的三列
+    df = pd.read_csv(filename, sep="\t", usecols=["TF", "IM", "Coor"])
+    codes, tfs = pd.factorize(df["TF"], sort=True)
+    im = df["IM"].to_numpy(dtype=float)
+    coor = df["Coor"].to_numpy(dtype=float)
+    # IM为空的边在任何阈值下都不保留
+    im = np.where(np.isnan(im), -np.inf, im)
+    im_thresholds = np.asarray(im_thresholds, dtype=float)
+    coor_thresholds = np.asarray(coor_thresholds, dtype=float)
+
+    # 按(TF, IM)排序，每个TF的边连续存放且组内IM升序
+    order = np.lexsort((im, codes))
+    codes, im, coor = codes[order], im[order], coor[order]
+    n_tf = len(tfs)
+    bounds = np.searchsorted(codes, np.arange(n_tf + 1))
+    starts, ends = bounds[:-1], bounds[1:]
+
+    # 将IM换成整数秩，与TF编号组合成单调递增的键，一次searchsorted得到每个TF中第一条IM大于阈值的边
+    uniq_im, im_rank = np.unique(im, return_inverse=True)
+    n_rank = len(uniq_im) + 1
+    keys = codes.astype(np.int64) * n_rank + im_rank
+    threshold_rank = np.searchsorted(uniq_im, im_thresholds, side="right")
+    queries = np.arange(n_tf, dtype=np.int64)[:, None] * n_rank + threshold_rank[None, :]
+    im_starts = np.searchsorted(keys, queries, side="left")
+
+    # 对每个Coor阈值做一次前缀和，IM通过的后缀中Coor也通过的边数即为前缀和之差
+    counts = np.empty((n_tf, len(im_thresholds), len(coor_thresholds)), dtype=np.int64)
+    for j, coor_threshold in enumerate(coor_thresholds):
+        cum = np.concatenate(([0], np.cumsum(coor > coor_threshold)))
+        counts[:, :, j] = cum[ends][:, None] - cum[im_starts]
+
+    # 整理为长表：TF、IM阈值、Coor阈值、总边数、IM过滤后边数、IM和Coor过滤后边数
+    n_im, n_coor = len(im_thresholds), len(coor_thresholds)
+    return pd.DataFrame({
+        "TF": np.repeat(np.asarray(tfs), n_im * n_coor),
+        "IM_threshold": np.tile(np.repeat(im_thresholds, n_coor), n_tf),
+        "Coor_threshold": np.tile(coor_thresholds, n_tf * n_im),
+        "Total": np.repeat(ends - starts, n_im * n_coor),
+        "IM_pass": np.repeat(ends[:, None] - im_starts, n_coor, axis=1).ravel(),
+        "IM_Coor_pass": counts.ravel(),
+    })
+
+
+# 从sweep_thresholds的结果中取出某一组阈值对应的三个列表，与process_data的返回值一致
+def sweep_count_lists(table, im_threshold, coor_threshold):
+    rows = table[(table["IM_threshold"] == im_threshold) & (table["Coor_threshold"] == coor_threshold)]
+    return rows["Total"].tolist(), rows["IM_pass"].tolist(), rows["IM_Coor_pass"].tolist()
+
+
 if __name__ == "__main__":
     # 调用函数
     count_list1, count_list2, count_list3 = process_data("rice_net.tsv", 0.03, 0.03)
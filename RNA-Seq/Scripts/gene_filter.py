@@ -0,0 +1,140 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 18:28:00
+@Description: Drop rarely expressed and low-variance genes before GRNBoost2 and correlation, always keeping TFs.
+@filename : gene_filter.py
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from expression_cache import read_expression
+from spearman_engine import load_tf_names
+
+"""
+python3 gene_filter.py -e [表达量阈值] -f [表达样本比例] -n [保留的高变基因数] [msu_fpkm_expression.csv] [tf_list.txt] [过滤后表达矩阵.csv]
+
+Filters are applied in this order, each to the genes left by the previous one:
+    min_expr      drop genes whose expression never reaches --min-expr in any sample
+    min_fraction  drop genes expressed (>= --min-expr) in fewer than --min-fraction of samples
+    top_variable  keep only the --top-variable genes with the largest variance or MAD
+Genes on the TF list are never dropped. Candidate edges are counted the way
+GRNBoost2 enumerates them: every TF in the matrix against every other gene.
+"""
+
+REPORT_COLUMNS = ['filter', 'genes_before', 'genes_removed', 'genes_after',
+                  'candidate_edges_before', 'candidate_edges_removed', 'candidate_edges_after']
+
+
+def candidate_edges(n_genes, n_tfs):
+    return n_tfs * max(n_genes - 1, 0)
+
+
+def dispersion(values, method='var'):
+    """Per-gene variance or median absolute deviation of a genes x samples array."""
+    if method == 'var':
+        return values.var(axis=1)
+    if method == 'mad':
+        return np.median(np.abs(values - np.median(values, axis=1, keepdims=True)), axis=1)
+    raise ValueError(f"unknown dispersion method {method!r}, expected 'var' or 'mad'")
+
+
+def filter_genes(expression_df, tf_names=(), min_expr=None, min_fraction=None, top_variable=None, method='var'):
+    """Return the filtered expression matrix and a per-filter report.
+
+    :param expression_df: genes x samples expression matrix
+    :param tf_names: transcription factors that are never removed
+    :param min_expr: expression level at which a gene counts as expressed in a sample
+    :param min_fraction: minimum fraction of samples in which a gene must be expressed
+    :param top_variable: number of most variable genes to keep (TFs are kept in addition)
+    :param method: 'var' or 'mad' ranking for top_variable
+    """
+    values = expression_df.to_numpy(dtype=np.float64)
+    is_tf = expression_df.index.isin(list(tf_names))
+    n_tfs = int(is_tf.sum())
+    keep = np.ones(len(values), dtype=bool)
+    report = []
+
+    def apply(name, passed):
+        before = int(keep.sum())
+        keep[:] = keep & (passed | is_tf)
+        after = int(keep.sum())
+        report.append([name, before, before - after, after, candidate_edges(before, n_tfs),
+                       candidate_edges(before, n_tfs) - candidate_edges(after, n_tfs), candidate_edges(after, n_tfs)])
+
+    if min_expr is not None:
+        expressed = values >= min_expr
+        apply('min_expr', expressed.any(axis=1))
+        if min_fraction is not None:
+            apply('min_fraction', expressed.mean(axis=1) >= min_fraction)
+    elif min_fraction is not None:
+        raise ValueError("min_fraction needs min_expr to define when a gene is expressed")
+
+    if top_variable is not None:
+        score = np.full(len(values), -np.inf)
+        candidates = keep & ~is_tf
+        score[candidates] = dispersion(values[candidates], method)
+        passed = np.zeros(len(values), dtype=bool)
+        n_keep = min(top_variable, int(candidates.sum()))
+        if n_keep > 0:
+            passed[np.argpartition(-score, n_keep - 1)[:n_keep]] = True
+        apply(f'top_variable_{method}', passed)
+
+    return expression_df[keep], pd.DataFrame(report, columns=REPORT_COLUMNS)
+
+
+def add_filter_args(parser):
+    parser.add_argument('-e', '--min-expr', type=float, default=None,
+                        help='expression level at which a gene counts as expressed in a sample')
+    parser.add_argument('-f', '--min-fraction', type=float, default=None,
+                        help='minimum fraction of samples in which a gene must be expressed (needs --min-expr)')
+    parser.add_argument('-n', '--top-variable', type=int, default=None,
+                        help='keep only this many most variable non-TF genes')
+    parser.add_argument('--dispersion', choices=['var', 'mad'], default='var',
+                        help='ranking used by --top-variable (default: var)')
+
+
+def check_filter_args(parser, args):
+    if args.min_fraction is not None and args.min_expr is None:
+        parser.error("--min-fraction requires --min-expr")
+
+
+def filter_requested(args):
+    return args.min_expr is not None or args.min_fraction is not None or args.top_variable is not None
+
+
+def print_report(report):
+    print(report.to_string(index=False))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Filter genes of an expression matrix before network inference.')
+    add_filter_args(parser)
+    parser.add_argument('-r', '--report', type=str, default=None, help='write the filter report to this TSV file')
+    parser.add_argument('--cache', action='store_true',
+                        help='load the expression matrix through its float32 binary cache (built on first use)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory for expression cache files (default: next to the expression file)')
+    parser.add_argument('expression_file', type=str, help='input gene expression matrix file (genes x samples)')
+    parser.add_argument('tf_file', type=str, help='transcription factor list file, one TF per line')
+    parser.add_argument('output_file', type=str, help='filtered expression matrix (CSV)')
+    args = parser.parse_args()
+    check_filter_args(parser, args)
+    return args
+
+
+def main():
+    args = parse_args()
+    expression_df = read_expression(args.expression_file, use_cache=args.cache, cache_dir=args.cache_dir)
+    tf_names = load_tf_names(args.tf_file)
+    filtered_df, report = filter_genes(expression_df, tf_names, args.min_expr, args.min_fraction,
+                                       args.top_variable, args.dispersion)
+    print_report(report)
+    filtered_df.to_csv(args.output_file)
+    if args.report:
+        report.to_csv(args.report, sep='\t', index=False)
+    print(f"{len(filtered_df)} of {len(expression_df)} genes saved to {args.output_file}")
+
+
+if __name__ == '__main__':
+    main()
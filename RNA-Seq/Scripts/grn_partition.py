@@ -0,0 +1,134 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 16:00:00
+@Description: Split GRNBoost2 inference into target-gene partitions and checkpoint each finished partition.
+@filename : grn_partition.py
+"""
+
+import hashlib
+import json
+import os
+import pandas as pd
+
+"""
+With sharding, the sorted target genes are dealt round-robin into N shards;
+shard i of N takes sorted_genes[i::N]. Every shard output has a .shard.json
+sidecar so the merge step can check that each shard is present exactly once.
+
+Each partition is written to <checkpoint_dir>/part-<index>-<digest>.tsv once it
+is complete; the digest is taken over the partition's target genes, so a file
+can only be reused for exactly the same targets. manifest.json records the run
+settings, and a checkpoint directory refuses to be reused for a different run.
+"""
+
+GRN_COLUMNS = ['TF', 'target', 'importance']
+DEFAULT_PARTITION_SIZE = 500
+
+
+def digest(items):
+    return hashlib.sha1('\n'.join(map(str, items)).encode()).hexdigest()
+
+
+def partition_targets(gene_names, partition_size=DEFAULT_PARTITION_SIZE):
+    """Split target genes into consecutive partitions of at most `partition_size` genes."""
+    gene_names = list(gene_names)
+    return [gene_names[start:start + partition_size] for start in range(0, len(gene_names), partition_size)]
+
+
+def parse_shard(spec):
+    """Parse an 'i/N' shard specification into (i, N) with 0 <= i < N."""
+    try:
+        index, count = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"invalid shard '{spec}', expected i/N such as 0/8")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"invalid shard '{spec}', i must be in [0, N)")
+    return index, count
+
+
+def shard_targets(gene_names, index, count):
+    """Deterministic 1/count slice of the target genes, independent of input column order."""
+    return sorted(gene_names)[index::count]
+
+
+def shard_info_path(path):
+    return path + '.shard.json'
+
+
+def write_shard(network, path, info):
+    """Write a shard network and its sidecar description."""
+    write_tsv_atomic(network[GRN_COLUMNS], path)
+    with open(shard_info_path(path) + '.tmp', 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(shard_info_path(path) + '.tmp', shard_info_path(path))
+
+
+def check_shards(paths):
+    """Make sure the given shard outputs form one complete, consistent run."""
+    infos = []
+    for path in paths:
+        if not os.path.exists(shard_info_path(path)):
+            raise ValueError(f"{path} has no {os.path.basename(shard_info_path(path))}; is the shard finished?")
+        with open(shard_info_path(path)) as f:
+            infos.append(json.load(f))
+    if not infos:
+        raise ValueError("no shard files given")
+    for key in ('n_shards', 'genes', 'tfs'):
+        if len({str(info[key]) for info in infos}) != 1:
+            raise ValueError(f"shard files disagree on '{key}'; they come from different runs")
+    count = infos[0]['n_shards']
+    indices = sorted(info['shard'] for info in infos)
+    if indices != list(range(count)):
+        missing = sorted(set(range(count)) - set(indices))
+        raise ValueError(f"expected shards 0..{count - 1} exactly once, missing {missing}, got {indices}")
+
+
+def write_tsv_atomic(df, path):
+    tmp_path = path + '.tmp'
+    df.to_csv(tmp_path, sep='\t', index=False)
+    os.replace(tmp_path, path)
+
+
+class CheckpointDir:
+    """Directory of finished GRNBoost2 partitions for one inference run."""
+
+    def __init__(self, path, run_settings):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                saved = json.load(f)
+            if saved != run_settings:
+                raise ValueError(f"checkpoint directory {path} belongs to a different run "
+                                 f"(input, TF list, seed or partition size changed); use a new directory")
+        else:
+            with open(manifest_path + '.tmp', 'w') as f:
+                json.dump(run_settings, f, indent=2)
+            os.replace(manifest_path + '.tmp', manifest_path)
+
+    def part_path(self, index, targets):
+        return os.path.join(self.path, f"part-{index:05d}-{digest(targets)[:12]}.tsv")
+
+    def is_done(self, index, targets):
+        return os.path.exists(self.part_path(index, targets))
+
+    def save(self, index, targets, network):
+        write_tsv_atomic(network[GRN_COLUMNS], self.part_path(index, targets))
+
+
+def merge_networks(part_files, pruner=None):
+    """Concatenate partition outputs and sort by importance as grnboost2 does.
+
+    With a TopKPerTF `pruner` the parts are streamed through it one at a time,
+    so only the kept edges are ever held in memory.
+    """
+    if pruner is not None:
+        for path in part_files:
+            pruner.add(pd.read_csv(path, sep='\t', float_precision='round_trip'))
+        return pruner.result()
+    parts = [pd.read_csv(path, sep='\t', float_precision='round_trip') for path in part_files]
+    if not parts:
+        return pd.DataFrame(columns=GRN_COLUMNS)
+    network = pd.concat(parts, ignore_index=True)
+    return network.sort_values(by='importance', ascending=False, kind='stable').reset_index(drop=True)
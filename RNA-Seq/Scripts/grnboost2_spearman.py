@@ -1,56 +1,143 @@
 import argparse
-import pandas as pd
 from distributed import Client, LocalCluster
 from arboreto.utils import load_tf_names
-from arboreto.algo import grnboost2
-from scipy.stats import spearmanr
-from multiprocessing import Pool
-parser = argparse.ArgumentParser(description='Compute gene regulatory network using GRNBoost2 algorithm.')
-parser.add_argument('i:qn_file', type=str, help='Input expression data file path (CSV format)')
-parser.add_argument('tf_file', type=str, help='Transcription factor list file path')
-parser.add_argument('out_file', type=str, help='Output gene regulatory network file path (TSV format)')
-args = parser.parse_args()
-
-def calculate_spearman_correlation(args):
-    geneA, geneB, expression_df = args
-    x = expression_df.loc[geneA]
-    y = expression_df.loc[geneB]
-    corr, pvalue = spearmanr(x, y)
-    return geneA, geneB, corr
+from arboreto.algo import grnboost2, _prepare_input
+from arboreto.core import create_graph, EARLY_STOP_WINDOW_LENGTH, SGBM_KWARGS
+from edge_pruning import TopKPerTF, add_pruning_args, prune_network
+from expression_cache import read_expression
+from gene_filter import add_filter_args, check_filter_args, filter_genes, filter_requested, print_report
+from grn_partition import (DEFAULT_PARTITION_SIZE, CheckpointDir, digest, merge_networks, parse_shard,
+                           partition_targets, shard_targets, write_shard)
+from spearman_engine import DEFAULT_CHUNK_SIZE, add_spearman_column
 
-if __name__ == '__main__':
-    ex_matrix = pd.read_csv(args.in_file, index_col=0).T
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compute gene regulatory network using GRNBoost2 algorithm.')
+    parser.add_argument('in_file', type=str, help='Input expression data file path (CSV format)')
+    parser.add_argument('tf_file', type=str, help='Transcription factor list file path')
+    parser.add_argument('out_file', type=str, help='Output gene regulatory network file path (TSV format)')
+    parser.add_argument('--checkpoint-dir', type=str, default=None,
+                        help='Run GRNBoost2 in target-gene partitions and keep finished partitions in this '
+                             'directory; a rerun skips partitions that are already complete')
+    parser.add_argument('--partition-size', type=int, default=DEFAULT_PARTITION_SIZE,
+                        help=f'Number of target genes per checkpointed partition (default: {DEFAULT_PARTITION_SIZE})')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for GRNBoost2')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Only infer shard i/N of the target genes and write the raw GRNBoost2 edges to '
+                             'out_file; combine the shards with merge_grn_shards.py')
+    parser.add_argument('--workers', type=int, default=4, help='Number of Dask workers (default: 4)')
+    parser.add_argument('--threads-per-worker', type=int, default=4, help='Threads per Dask worker (default: 4)')
+    parser.add_argument('--dashboard-address', type=str, default=':12345',
+                        help="Dask dashboard address, e.g. ':0' for a random port (default: :12345)")
+    add_filter_args(parser)
+    add_pruning_args(parser)
+    parser.add_argument('--cache', action='store_true',
+                        help='Load the expression matrix through its float32 binary cache (built on first use)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Directory for expression cache files (default: next to the expression file)')
+    parser.add_argument('-t', '--threads', type=int, default=16,
+                        help='Number of processes for the Spearman stage (default: 16)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Number of gene pairs per worker task (default: {DEFAULT_CHUNK_SIZE})')
+    args = parser.parse_args()
+    check_filter_args(parser, args)
+    if args.shard is not None:
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.checkpoint_dir is not None and args.seed is None:
+        print("Warning: --checkpoint-dir without --seed; partitions of a resumed run come from different "
+              "random states. Set --seed to make resumed results reproducible.")
+    return args
+
+
+def infer_targets(ex_matrix, tf_names, targets, client, seed=None):
+    """Run GRNBoost2 for the given target genes only, with every TF as candidate regulator."""
+    expression_matrix, gene_names, tf_names = _prepare_input(ex_matrix, None, tf_names)
+    graph = create_graph(expression_matrix, gene_names, tf_names, client=client, regressor_type='GBM',
+                         regressor_kwargs=SGBM_KWARGS, target_genes=list(targets),
+                         early_stop_window_length=EARLY_STOP_WINDOW_LENGTH, seed=seed)
+    return client.compute(graph, sync=True).sort_values(by='importance', ascending=False)
+
+
+def run_settings(ex_matrix, tf_names, args):
+    return {
+        'genes': digest(ex_matrix.columns),
+        'n_samples': ex_matrix.shape[0],
+        'tfs': digest(sorted(tf_names)),
+        'seed': args.seed,
+        'partition_size': args.partition_size,
+        'shard': list(args.shard) if args.shard else None,
+    }
+
+
+def infer_checkpointed(ex_matrix, tf_names, targets, client, args):
+    """Infer the network partition by partition, skipping partitions already in the checkpoint directory."""
+    checkpoint = CheckpointDir(args.checkpoint_dir, run_settings(ex_matrix, tf_names, args))
+    partitions = partition_targets(targets, args.partition_size)
+    for index, targets in enumerate(partitions):
+        if checkpoint.is_done(index, targets):
+            print(f"Partition {index + 1}/{len(partitions)} already complete, skipped.")
+            continue
+        print(f"Computing partition {index + 1}/{len(partitions)} ({len(targets)} target genes)...")
+        checkpoint.save(index, targets, infer_targets(ex_matrix, tf_names, targets, client, seed=args.seed))
+    pruner = TopKPerTF(args.top_k, args.min_im) if args.top_k is not None or args.min_im is not None else None
+    return merge_networks([checkpoint.part_path(index, targets) for index, targets in enumerate(partitions)], pruner)
+
+
+def main():
+    args = parse_args()
+    ex_matrix = read_expression(args.in_file, orientation='samples', use_cache=args.cache, cache_dir=args.cache_dir)
     print(f"Loaded expression matrix: {ex_matrix.shape[1]} genes x {ex_matrix.shape[0]} samples.")
     tf_names = load_tf_names(args.tf_file)
     print(f"Loaded {len(tf_names)} transcription factors.")
-    cluster = LocalCluster(n_workers=4, threads_per_worker=4, dashboard_address=':12345')
+    if filter_requested(args):
+        filtered_df, report = filter_genes(ex_matrix.T, tf_names, args.min_expr, args.min_fraction,
+                                           args.top_variable, args.dispersion)
+        print_report(report)
+        ex_matrix = filtered_df.T
+        print(f"Filtered expression matrix: {ex_matrix.shape[1]} genes x {ex_matrix.shape[0]} samples.")
+    targets = list(ex_matrix.columns)
+    if args.shard:
+        targets = shard_targets(targets, *args.shard)
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(targets)} target genes.")
+    cluster = LocalCluster(n_workers=args.workers, threads_per_worker=args.threads_per_worker,
+                           dashboard_address=args.dashboard_address)
     client = Client(cluster)
     try:
         print("Computing gene regulatory network...")
-        network = grnboost2(expression_data=ex_matrix, tf_names=tf_names, client_or_address=client)
+        if args.checkpoint_dir:
+            network = infer_checkpointed(ex_matrix, tf_names, targets, client, args)
+        elif args.shard:
+            network = infer_targets(ex_matrix, tf_names, targets, client, seed=args.seed)
+        else:
+            network = grnboost2(expression_data=ex_matrix, tf_names=tf_names, client_or_address=client,
+                                seed=args.seed)
     except Exception as e:
         print(f"Error during computation: {e}.")
+        if args.checkpoint_dir:
+            print(f"Finished partitions are kept in {args.checkpoint_dir}; rerun the same command to resume.")
         raise Exception("GRNBoost2 Computation Failed!")
     finally:
         client.close()
         cluster.close()
     print("GRNBoost2 compute done")
+    if args.shard:
+        info = run_settings(ex_matrix, tf_names, args)
+        info.update({'shard': args.shard[0], 'n_shards': args.shard[1], 'n_targets': len(targets)})
+        write_shard(network, args.out_file, info)
+        print(f"Shard saved to {args.out_file}, merge all shards with merge_grn_shards.py")
+        return
+    if not args.checkpoint_dir:
+        network = prune_network(network, args.top_k, args.min_im)
+    print(f"{len(network)} edges kept for the Spearman stage")
     expression_df = ex_matrix.T
-    network_df = network
-    network_df.columns = ['TF', 'TG', 'IM']
-    print("input file load success")
-    all_genes = set(network_df['TF']).union(set(network_df['TG']))
-    print("all_genes load success")
-    network_array = network_df.to_numpy()
-    gene_pairs = network_array[:, [0, 1]]
-    print("gene_paires load success")
-    pool = Pool(processes=16)
     print("allocate threads")
-    results = pool.map(calculate_spearman_correlation, [(TF, TG, expression_df) for TF, TG in gene_pairs])
-    pool.close()
-    pool.join()
+    df_merged = add_spearman_column(network, expression_df, processes=args.threads, chunk_size=args.chunk_size)
     print("calculate done, saving to disk")
-    results_df = pd.DataFrame(results, columns=['TF', 'TG', 'Coor'])
-    df_merged = pd.merge(network, results_df, on=['TF', 'TG'])
     df_merged.to_csv(args.out_file, sep='\t', index=False)
 
+
+if __name__ == '__main__':
+    main()
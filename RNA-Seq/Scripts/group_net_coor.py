@@ -6,8 +6,14 @@
 """
 
 import argparse
+import heapq
+import mmap
 import os
+import tempfile
+from collections import OrderedDict
+from itertools import groupby
 import pandas as pd
+from regulon_store import RegulonStoreWriter
 
 
 def parse_args():
@@ -18,9 +24,137 @@ def parse_args():
     parser.add_argument('net_coor_file', type=str, help='网络坐标文件路径')
     parser.add_argument('-t', '--threshold', type=float, default=0.03, help='阈值，默认为0.03')
     parser.add_argument('-d', '--dest_dir', type=str, default='groups', help='输出目录，默认为当前目录下的groups文件夹')
+    parser.add_argument('-s', '--store', type=str, default=None,
+                        help='regulon存储文件路径，指定后写入单文件存储（附带.idx索引）而不是每个TF一个文件')
+    parser.add_argument('-c', '--chunksize', type=int, default=None,
+                        help='分块读取的行数，指定后以流式方式分块过滤和分组，内存占用与网络大小无关')
+    parser.add_argument('--buffer_lines', type=int, default=1000000,
+                        help='流式模式下内存中缓存的靶基因行数上限，默认为1000000')
+    parser.add_argument('--max_open', type=int, default=256, help='流式模式下同时打开的文件数上限，默认为256')
+    parser.add_argument('--tmp_dir', type=str, default=None,
+                        help='流式写入存储时临时文件所在目录，默认为系统临时目录（本地磁盘）')
     return parser.parse_args()
 
 
+class GroupWriter:
+    """
+    按TF缓存靶基因并追加写入{TF}.txt，缓存行数和打开的文件数都有上限
+    """
+
+    def __init__(self, dest_dir, buffer_lines=1000000, max_open=256):
+        self.dest_dir = dest_dir
+        self.buffer_lines = buffer_lines
+        self.max_open = max_open
+        self.buffers = {}
+        self.n_buffered = 0
+        self.handles = OrderedDict()
+        self.created = set()
+
+    def _handle(self, name):
+        # 最近使用的文件保持打开，超过上限时关闭最久未使用的文件
+        if name in self.handles:
+            self.handles.move_to_end(name)
+            return self.handles[name]
+        if len(self.handles) >= self.max_open:
+            _, oldest = self.handles.popitem(last=False)
+            oldest.close()
+        # 每个TF第一次写入时覆盖旧文件，之后追加
+        mode = 'a' if name in self.created else 'w'
+        self.created.add(name)
+        handle = open(os.path.join(self.dest_dir, f"{name}.txt"), mode, buffering=1024 * 1024)
+        self.handles[name] = handle
+        return handle
+
+    def add(self, name, targets):
+        self.buffers.setdefault(name, []).extend(targets)
+        self.n_buffered += len(targets)
+        if self.n_buffered >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        for name, targets in self.buffers.items():
+            self._handle(name).write(''.join(f"{x}\n" for x in targets))
+        self.buffers = {}
+        self.n_buffered = 0
+
+    def close(self):
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+
+def stream_groups(net_coor_file, threshold, dest_dir, chunksize, buffer_lines=1000000, max_open=256):
+    """
+    分块读取网络文件，逐块过滤并按第一列分组追加写入，输出与一次性读入完全相同
+    """
+    columns = pd.read_csv(net_coor_file, sep='\t', header=0, nrows=0).columns
+    # 前两列按字符串读取，避免不同分块推断出不同的类型
+    dtype = {columns[0]: str, columns[1]: str}
+    writer = GroupWriter(dest_dir, buffer_lines, max_open)
+    try:
+        for chunk in pd.read_csv(net_coor_file, sep='\t', header=0, dtype=dtype, chunksize=chunksize):
+            chunk = chunk[chunk.iloc[:, 2] > threshold]
+            for group_name, group in chunk.groupby(chunk.columns[0], sort=False):
+                writer.add(f"{group_name}", group.iloc[:, 1].tolist())
+    finally:
+        writer.close()
+
+
+def iter_run(mm, start, end):
+    """逐行读取临时文件中的一段有序数据，返回(TF, 靶基因)"""
+    pos = start
+    while pos < end:
+        stop = mm.find(b'\n', pos, end)
+        tf, target = mm[pos:stop].split(b'\t', 1)
+        yield tf, target
+        pos = stop + 1
+
+
+def stream_store(net_coor_file, threshold, store_path, chunksize, buffer_lines=1000000, tmp_dir=None):
+    """
+    分块读取网络文件并直接写入regulon存储，不生成每个TF一个的中间文件
+
+    过滤后的(TF, 靶基因)每积累buffer_lines行按TF稳定排序，作为一段有序数据追加到同一个临时文件；
+    最后对各段做k路归并（heapq.merge是稳定的，同一TF的靶基因保持原文件中的顺序），按TF名顺序写入存储，
+    结果与一次性读入后写入存储完全相同。
+    """
+    columns = pd.read_csv(net_coor_file, sep='\t', header=0, nrows=0).columns
+    dtype = {columns[0]: str, columns[1]: str}
+    runs = []
+    with tempfile.TemporaryFile(dir=tmp_dir) as spill:
+        pending, n_pending = [], 0
+
+        def spill_run():
+            run = pd.concat(pending).sort_values(columns[0], kind='mergesort')
+            start = spill.tell()
+            spill.write(''.join(f"{tf}\t{target}\n" for tf, target in zip(run.iloc[:, 0], run.iloc[:, 1])).encode())
+            runs.append((start, spill.tell()))
+
+        for chunk in pd.read_csv(net_coor_file, sep='\t', header=0, dtype=dtype, chunksize=chunksize):
+            chunk = chunk[chunk.iloc[:, 2] > threshold].iloc[:, :2]
+            if chunk.empty:
+                continue
+            pending.append(chunk)
+            n_pending += len(chunk)
+            if n_pending >= buffer_lines:
+                spill_run()
+                pending, n_pending = [], 0
+        if pending:
+            spill_run()
+        spill.flush()
+
+        with RegulonStoreWriter(store_path) as writer:
+            if not runs:
+                return 0
+            with mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                merged = heapq.merge(*(iter_run(mm, start, end) for start, end in runs), key=lambda x: x[0])
+                for tf, pairs in groupby(merged, key=lambda x: x[0]):
+                    targets = [target for _, target in pairs]
+                    writer.add_bytes(tf.decode(), b''.join(target + b'\n' for target in targets), len(targets))
+    return len(runs)
+
+
 def main():
     args = parse_args()
 
@@ -28,9 +162,27 @@ def main():
         print(f"Error: 文件 {args.net_coor_file} 不存在。")
         return
 
+    if args.chunksize:
+        if args.store:
+            # 有序分段写入一个本地临时文件，归并后直接写入单文件存储
+            stream_store(args.net_coor_file, args.threshold, args.store, args.chunksize,
+                         args.buffer_lines, args.tmp_dir)
+        else:
+            if not os.path.exists(args.dest_dir):
+                os.makedirs(args.dest_dir)
+            stream_groups(args.net_coor_file, args.threshold, args.dest_dir, args.chunksize,
+                          args.buffer_lines, args.max_open)
+        return
+
     df = pd.read_csv(args.net_coor_file, sep='\t', header=0)
     groups = df[df.iloc[:, 2] > args.threshold].groupby(df.columns[0])
 
+    if args.store:
+        with RegulonStoreWriter(args.store) as writer:
+            for group_name, group in groups:
+                writer.add(f"{group_name}", group.iloc[:, 1])
+        return
+
     if not os.path.exists(args.dest_dir):
         os.makedirs(args.dest_dir)
 
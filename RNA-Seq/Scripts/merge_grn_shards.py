@@ -0,0 +1,52 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 17:00:00
+@Description: Merge GRNBoost2 shard outputs written by grnboost2_spearman.py --shard and add spearman correlation.
+@filename : merge_grn_shards.py
+"""
+
+import argparse
+from edge_pruning import TopKPerTF, add_pruning_args
+from expression_cache import read_expression
+from grn_partition import check_shards, merge_networks
+from spearman_engine import DEFAULT_CHUNK_SIZE, add_spearman_column
+
+"""
+for i in $(seq 0 7); do python3 grnboost2_spearman.py --shard $i/8 expr.csv tf.txt shard_$i.tsv; done
+python3 merge_grn_shards.py -e expr.csv net_grn_output.tsv shard_*.tsv
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Merge GRNBoost2 shard outputs into one network.')
+    parser.add_argument('-e', '--expression-file', type=str, default=None,
+                        help='Expression matrix (CSV, genes x samples); if given, add the spearman Coor column')
+    parser.add_argument('-t', '--threads', type=int, default=16,
+                        help='Number of processes for the Spearman stage (default: 16)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Number of gene pairs per worker task (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--cache', action='store_true',
+                        help='load the expression matrix through its float32 binary cache (built on first use)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory for expression cache files (default: next to the expression file)')
+    add_pruning_args(parser)
+    parser.add_argument('out_file', type=str, help='Output gene regulatory network file path (TSV format)')
+    parser.add_argument('shard_files', type=str, nargs='+', help='Shard outputs of grnboost2_spearman.py --shard')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    check_shards(args.shard_files)
+    pruner = TopKPerTF(args.top_k, args.min_im) if args.top_k is not None or args.min_im is not None else None
+    network = merge_networks(args.shard_files, pruner)
+    print(f"Merged {len(args.shard_files)} shards: {len(network)} edges kept.")
+    if args.expression_file:
+        expression_df = read_expression(args.expression_file, use_cache=args.cache, cache_dir=args.cache_dir)
+        network = add_spearman_column(network, expression_df, processes=args.threads, chunk_size=args.chunk_size)
+        print("calculate done, saving to disk")
+    network.to_csv(args.out_file, sep='\t', index=False)
+
+
+if __name__ == '__main__':
+    main()
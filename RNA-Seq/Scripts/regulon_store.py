@@ -0,0 +1,161 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 18:29:00
+@Description: 单文件regulon存储：一个数据文件加一个按TF索引的偏移表，代替groups/目录下成千上万的{TF}.txt小文件。
+@filename : regulon_store.py
+"""
+
+import argparse
+import mmap
+import os
+
+"""
+python3 regulon_store.py export [regulons.store] [regulons]    # 导出为每个TF一个{TF}.txt的目录
+python3 regulon_store.py pack [groups] [regulons.store]        # 将已有的{TF}.txt目录打包为单文件存储
+
+存储由两个文件组成：
+    regulons.store      所有TF的靶基因，每个TF一段，每段内容与{TF}.txt完全相同（每行一个基因）
+    regulons.store.idx  制表符分隔的索引：TF、字节偏移、字节长度、靶基因个数
+读取时通过mmap按偏移随机访问，不需要打开或列出大量小文件。
+"""
+
+INDEX_SUFFIX = '.idx'
+
+
+def encode_genes(genes):
+    """与分组脚本写{TF}.txt的格式一致：每行一个基因，末尾换行"""
+    return ('\n'.join(genes) + '\n').encode()
+
+
+class RegulonStoreWriter:
+    """顺序写入regulon存储，每个TF只能写入一次"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = open(path + '.tmp', 'wb')
+        self._index = []
+        self._seen = set()
+        self._offset = 0
+
+    def add_bytes(self, tf, data, count):
+        if tf in self._seen:
+            raise ValueError(f"TF {tf} 已写入存储")
+        self._seen.add(tf)
+        self._data.write(data)
+        self._index.append(f"{tf}\t{self._offset}\t{len(data)}\t{count}\n")
+        self._offset += len(data)
+
+    def add(self, tf, genes):
+        genes = list(genes)
+        self.add_bytes(tf, encode_genes(genes), len(genes))
+
+    def close(self):
+        self._data.close()
+        with open(self.path + INDEX_SUFFIX + '.tmp', 'w') as f:
+            f.writelines(self._index)
+        os.replace(self.path + '.tmp', self.path)
+        os.replace(self.path + INDEX_SUFFIX + '.tmp', self.path + INDEX_SUFFIX)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # 出错时删除写了一半的临时文件，已有的存储保持不变
+            self._data.close()
+            os.remove(self.path + '.tmp')
+
+
+class RegulonStore:
+    """通过mmap随机读取regulon存储"""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        with open(path + INDEX_SUFFIX) as f:
+            for line in f:
+                tf, offset, length, count = line.rstrip('\n').split('\t')
+                self.index[tf] = (int(offset), int(length), int(count))
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __contains__(self, tf):
+        return tf in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def count(self, tf):
+        return self.index[tf][2]
+
+    def get_bytes(self, tf):
+        offset, length, _ = self.index[tf]
+        return self._mm[offset:offset + length]
+
+    def genes(self, tf):
+        """返回TF的靶基因列表，TF不存在时抛出KeyError"""
+        return [x for x in self.get_bytes(tf).decode().split('\n') if x != '']
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def export_directory(store_path, dest_dir):
+    """将存储导出为每个TF一个{TF}.txt文件的目录"""
+    os.makedirs(dest_dir, exist_ok=True)
+    with RegulonStore(store_path) as store:
+        for tf in store:
+            with open(os.path.join(dest_dir, f"{tf}.txt"), 'wb') as f:
+                f.write(store.get_bytes(tf))
+        return len(store)
+
+
+def pack_directory(src_dir, store_path):
+    """将{TF}.txt目录打包为单文件存储，按TF名排序写入"""
+    names = sorted((x for x in os.listdir(src_dir) if x.endswith('.txt')), key=lambda x: x[:-len('.txt')])
+    with RegulonStoreWriter(store_path) as writer:
+        for name in names:
+            with open(os.path.join(src_dir, name), 'rb') as f:
+                data = f.read()
+            writer.add_bytes(name[:-len('.txt')], data, sum(1 for x in data.split(b'\n') if x))
+    return len(names)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='regulon单文件存储的导出与打包。')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='导出为每个TF一个{TF}.txt的目录')
+    export_parser.add_argument('store', type=str, help='regulon存储文件路径')
+    export_parser.add_argument('dest_dir', type=str, help='输出目录')
+    pack_parser = subparsers.add_parser('pack', help='将{TF}.txt目录打包为单文件存储')
+    pack_parser.add_argument('src_dir', type=str, help='包含{TF}.txt的目录')
+    pack_parser.add_argument('store', type=str, help='regulon存储文件路径')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'export':
+        n = export_directory(args.store, args.dest_dir)
+        print(f"导出 {n} 个TF到 {args.dest_dir}")
+    else:
+        n = pack_directory(args.src_dir, args.store)
+        print(f"打包 {n} 个TF到 {args.store}")
+
+
+if __name__ == '__main__':
+    main()
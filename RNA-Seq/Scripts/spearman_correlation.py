@@ -6,71 +6,134 @@
 """
 
 import argparse
+import os
 import pandas as pd
-from scipy.stats import spearmanr
-from multiprocessing import Pool
+from bh_fdr import bh_qvalues, external_bh
+from expression_cache import read_expression
+from spearman_engine import DEFAULT_CHUNK_SIZE, EdgeCorrelator, RankedExpression, correlate_edges, spearman_pvalues
 
 """
-python3 spearman_correlation.py -t [线程数] [msu_fpkm_expression.csv] [net_grn_output.tsv] [输出文件名]
+python3 spearman_correlation.py -t [线程数] -c [每个任务的基因对数] [msu_fpkm_expression.csv] [net_grn_output.tsv] [输出文件名]
+python3 spearman_correlation.py --stream --stream-rows [每块读取的行数] [msu_fpkm_expression.csv] [net_grn_output.tsv] [输出文件名]
+python3 spearman_correlation.py --pvalue --fdr [msu_fpkm_expression.csv] [net_grn_output.tsv] [输出文件名]
 """
 
+NETWORK_COLUMNS = ['GeneA', 'GeneB', 'Corr']
+MIN_NETWORK_WEIGHT = 0.005
+DEFAULT_STREAM_ROWS = 1000000
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Calculate Spearman correlation between gene pairs.')
     parser.add_argument('-t', '--threads', type=int, default=1, help='number of threads to use (default: 1)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'number of gene pairs per worker task (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the network in chunks and append results to the output as they are computed')
+    parser.add_argument('--stream-rows', type=int, default=DEFAULT_STREAM_ROWS,
+                        help=f'network rows read per chunk in --stream mode (default: {DEFAULT_STREAM_ROWS})')
+    parser.add_argument('--cache', action='store_true',
+                        help='load the expression matrix through its float32 binary cache (built on first use)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory for expression cache files (default: next to the expression file)')
+    parser.add_argument('--pvalue', action='store_true', help='add a PValue column for each edge')
+    parser.add_argument('--fdr', action='store_true',
+                        help='add PValue and Benjamini-Hochberg QValue columns for each edge')
     parser.add_argument('expression_file', type=str, help='input gene expression matrix file')
     parser.add_argument('network_file', type=str, help='input gene network file')
     parser.add_argument('output_file', type=str, help='output file')
     args = parser.parse_args()
+    args.pvalue = args.pvalue or args.fdr
     return args
 
 
-def read_expression_file(expression_file):
-    df = pd.read_csv(expression_file, index_col=0)
+def read_expression_file(expression_file, use_cache=False, cache_dir=None):
+    df = read_expression(expression_file, use_cache=use_cache, cache_dir=cache_dir)
     return df
 
 
-def read_network_file(network_file):
-    df = pd.read_csv(network_file, delimiter='\t', header=None, names=['GeneA', 'GeneB', 'Corr'])
+def filter_network(df):
     # Filter out low correlation gene pairs
-    df = df[df['Corr'] >= 0.005]
-    return df
+    return df[df['Corr'] >= MIN_NETWORK_WEIGHT]
 
 
-def calculate_spearman_correlation(args):
-    geneA, geneB, expression_df = args
-    x = expression_df.loc[geneA]
-    y = expression_df.loc[geneB]
-    corr, pvalue = spearmanr(x, y)
-    return geneA, geneB, corr
+def read_network_file(network_file):
+    df = pd.read_csv(network_file, delimiter='\t', header=None, names=NETWORK_COLUMNS)
+    return filter_network(df)
+
+
+def iter_network_chunks(network_file, chunk_rows=DEFAULT_STREAM_ROWS):
+    # Yield filtered network chunks in file order, never holding the whole file in memory
+    reader = pd.read_csv(network_file, delimiter='\t', header=None, names=NETWORK_COLUMNS, chunksize=chunk_rows)
+    for chunk in reader:
+        yield filter_network(chunk)
+
+
+def build_results(network_df, corr, pvalues=None):
+    results_df = pd.DataFrame({'GeneA': network_df['GeneA'].to_numpy(),
+                               'GeneB': network_df['GeneB'].to_numpy(),
+                               'Spearman_Correlation': corr})
+    if pvalues is not None:
+        results_df['PValue'] = pvalues
+    return results_df
+
+
+def stream_correlations(args, ranked):
+    # Correlate the network chunk by chunk, appending each chunk's results in input order
+    output_file = args.output_file + '.tmp' if args.fdr else args.output_file
+    n_edges = 0
+    first = True
+    with EdgeCorrelator(ranked, processes=args.threads, chunk_size=args.chunk_size) as correlator:
+        for chunk in iter_network_chunks(args.network_file, args.stream_rows):
+            corr = correlator.correlate(chunk['GeneA'].to_numpy(), chunk['GeneB'].to_numpy())
+            pvalues = spearman_pvalues(corr, ranked.n_samples) if args.pvalue else None
+            build_results(chunk, corr, pvalues).to_csv(output_file, sep='\t', index=False,
+                                                       mode='w' if first else 'a', header=first)
+            first = False
+            n_edges += len(chunk)
+            print(f"{n_edges} edges written")
+    if first:
+        empty = pd.DataFrame(columns=NETWORK_COLUMNS)
+        build_results(empty, [], [] if args.pvalue else None).to_csv(output_file, sep='\t', index=False)
+
+    if args.fdr:
+        # The q-value pass sorts p-values on disk, so it stays out-of-core as well
+        print("computing q-values")
+        external_bh(output_file, args.output_file, chunk_rows=args.stream_rows)
+        os.remove(output_file)
 
 
 def main():
     args = parse_args()
 
     # Read input files
-    expression_df = read_expression_file(args.expression_file)
+    expression_df = read_expression_file(args.expression_file, args.cache, args.cache_dir)
+    if args.stream:
+        ranked = RankedExpression(expression_df)
+        del expression_df
+        print("expression ranks ready, streaming network")
+        stream_correlations(args, ranked)
+        print("calculate done")
+        return
+
     network_df = read_network_file(args.network_file)
     print("input file load success")
-    # Get unique genes from the network dataframe
-    all_genes = set(network_df['GeneA']).union(set(network_df['GeneB']))
-    print("all_genes load success")
 
-    # Create tuples of gene pairs for calculating Spearman correlation
-    network_array = network_df.to_numpy()
-    gene_pairs = network_array[:, [0, 1]]
-    print("gene_paires load success")
+    # Rank the expression matrix once; each edge is then a dot product of two rank rows
+    ranked = RankedExpression(expression_df)
+    print("expression ranks ready")
 
-    # Use multiprocessing to calculate Spearman correlation in parallel
-    pool = Pool(processes=args.threads)
+    # Compute Spearman correlation for all edges in vectorized batches
     print("allocate threads")
-    results = pool.map(calculate_spearman_correlation, [(geneA, geneB, expression_df) for geneA, geneB in gene_pairs])
-    pool.close()
-    pool.join()
+    corr = correlate_edges(ranked, network_df['GeneA'].to_numpy(), network_df['GeneB'].to_numpy(),
+                           processes=args.threads, chunk_size=args.chunk_size)
 
     print("calculate done, saving to disk")
     # Convert results to a dataframe and save to output file
-    results_df = pd.DataFrame(results, columns=['GeneA', 'GeneB', 'Spearman_Correlation'])
+    pvalues = spearman_pvalues(corr, ranked.n_samples) if args.pvalue else None
+    results_df = build_results(network_df, corr, pvalues)
+    if args.fdr:
+        results_df['QValue'] = bh_qvalues(pvalues)
     results_df.to_csv(args.output_file, sep='\t', index=False)
 
 
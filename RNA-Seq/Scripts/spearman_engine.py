@@ -0,0 +1,237 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 10:00:00
+@Description: Vectorized Spearman correlation engine shared by the RNA-Seq scripts.
+@filename : spearman_engine.py
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata, t as t_dist
+from multiprocessing import Pool, shared_memory
+
+"""
+The expression matrix is ranked once (average ranks for ties, exactly as
+scipy.stats.spearmanr does) and every row is centered and scaled to unit norm.
+The Spearman rho of two genes is then the dot product of their rows, so a
+batch of edges is a single row-wise einsum instead of one spearmanr call each.
+Worker processes attach to one read-only copy of the ranks in shared memory and
+receive only integer gene indices, never the expression matrix itself.
+"""
+
+DEFAULT_BATCH_SIZE = 100000
+DEFAULT_CHUNK_SIZE = 100000
+
+_worker_ranks = None
+_worker_shm = None
+
+
+def rank_matrix(values):
+    """Return row-wise ranks of `values`, centered and scaled to unit norm.
+
+    Rows that are constant (or contain NaN) become all-NaN, which matches the
+    nan that spearmanr returns for them.
+    """
+    ranks = rankdata(np.asarray(values, dtype=np.float64), axis=1)
+    ranks -= ranks.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', ranks, ranks))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ranks /= norms[:, None]
+    ranks[norms == 0] = np.nan
+    return ranks
+
+
+class RankedExpression:
+    """Pre-ranked expression matrix (genes x samples) with a gene name lookup."""
+
+    def __init__(self, expression_df):
+        self.genes = pd.Index(expression_df.index)
+        if not self.genes.is_unique:
+            raise ValueError("expression matrix contains duplicated gene IDs")
+        self.ranks = rank_matrix(expression_df.to_numpy())
+        self.n_samples = self.ranks.shape[1]
+
+    def indices(self, genes):
+        idx = self.genes.get_indexer(genes)
+        if (idx < 0).any():
+            missing = pd.unique(np.asarray(genes, dtype=object)[idx < 0])
+            raise KeyError(f"{len(missing)} genes not found in expression matrix, e.g. {list(missing[:5])}")
+        return idx
+
+
+def correlate_pairs(ranks, idx_a, idx_b, batch_size=DEFAULT_BATCH_SIZE):
+    """Spearman rho for every (idx_a[k], idx_b[k]) pair of pre-ranked rows."""
+    idx_a = np.asarray(idx_a, dtype=np.int64)
+    idx_b = np.asarray(idx_b, dtype=np.int64)
+    out = np.empty(len(idx_a), dtype=np.float64)
+    for start in range(0, len(idx_a), batch_size):
+        end = start + batch_size
+        out[start:end] = np.einsum('ij,ij->i', ranks[idx_a[start:end]], ranks[idx_b[start:end]])
+    np.clip(out, -1.0, 1.0, out=out)
+    return out
+
+
+def spearman_pvalues(rho, n_samples):
+    """Two-sided p-values for an array of Spearman rho, computed as spearmanr does.
+
+    Uses the t-distribution with n - 2 degrees of freedom over the whole array.
+    """
+    rho = np.asarray(rho, dtype=np.float64)
+    dof = n_samples - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = rho * np.sqrt((dof / ((rho + 1.0) * (1.0 - rho))).clip(0))
+    return 2 * t_dist.sf(np.abs(t), dof)
+
+
+def _init_worker(shm_name, shape, dtype):
+    global _worker_ranks, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_ranks = np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf)
+    _worker_ranks.flags.writeable = False
+
+
+def _correlate_chunk(args):
+    idx_a, idx_b = args
+    return correlate_pairs(_worker_ranks, idx_a, idx_b)
+
+
+class EdgeCorrelator:
+    """Compute edge correlations over a pool of workers sharing one rank matrix.
+
+    Use as a context manager; the shared memory block and the pool live until
+    exit, so the same correlator can be fed many batches of edges.
+    """
+
+    def __init__(self, ranked, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.ranked = ranked
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._shm = None
+        self._pool = None
+
+    def __enter__(self):
+        if self.processes > 1:
+            ranks = self.ranked.ranks
+            self._shm = shared_memory.SharedMemory(create=True, size=max(ranks.nbytes, 1))
+            shared = np.ndarray(ranks.shape, dtype=ranks.dtype, buffer=self._shm.buf)
+            shared[:] = ranks
+            # The parent also reads the shared block, so the ranks exist only once while the pool lives
+            self.ranked.ranks = shared
+            del ranks
+            self._pool = Pool(processes=self.processes, initializer=_init_worker,
+                              initargs=(self._shm.name, shared.shape, shared.dtype.str))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            # Move the ranks back to private memory before the shared block goes away
+            self.ranked.ranks = np.array(self.ranked.ranks)
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def correlate(self, genes_a, genes_b):
+        """Spearman rho for each (genes_a[k], genes_b[k]) edge, in input order."""
+        idx_a = self.ranked.indices(genes_a)
+        idx_b = self.ranked.indices(genes_b)
+        if self._pool is None or len(idx_a) <= self.chunk_size:
+            return correlate_pairs(self.ranked.ranks, idx_a, idx_b)
+
+        chunks = [(idx_a[start:start + self.chunk_size], idx_b[start:start + self.chunk_size])
+                  for start in range(0, len(idx_a), self.chunk_size)]
+        return np.concatenate(self._pool.map(_correlate_chunk, chunks))
+
+
+def correlate_edges(ranked, genes_a, genes_b, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Spearman rho for each (genes_a[k], genes_b[k]) edge, in input order."""
+    with EdgeCorrelator(ranked, processes=processes, chunk_size=chunk_size) as correlator:
+        return correlator.correlate(genes_a, genes_b)
+
+
+def add_spearman_column(network, expression_df, processes=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rename a GRNBoost2 network to TF/TG/IM and append the Spearman rho of each edge as Coor."""
+    network.columns = ['TF', 'TG', 'IM']
+    ranked = RankedExpression(expression_df)
+    print("expression ranks ready")
+    network['Coor'] = correlate_edges(ranked, network['TF'].to_numpy(), network['TG'].to_numpy(),
+                                      processes=processes, chunk_size=chunk_size)
+    return network
+
+
+def load_tf_names(path):
+    """Read a transcription factor list, one name per line (same format as arboreto.utils.load_tf_names)."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def block_rows_for_budget(n_genes, memory_mb, top_k=None, n_samples=0):
+    """Number of TF rows whose correlation block and all its temporaries fit in `memory_mb`.
+
+    Per TF row, in n_genes-sized 8-byte arrays, tf_gene_correlation_blocks holds at most
+    rho, the negated score and the argpartition indices when `top_k` limits the targets,
+    and rho, the sort order, the sorted scores and the edge output (row and column
+    indices, then target, rho and TF arrays) when every target may be kept; bool masks
+    add one byte each.
+    """
+    itemsize = np.dtype(np.float64).itemsize
+    if top_k is not None and top_k < n_genes:
+        bytes_per_row = n_genes * (3 * itemsize + 1)
+    else:
+        bytes_per_row = n_genes * (5 * itemsize + 1)
+    bytes_per_row += n_samples * itemsize
+    return max(1, int(memory_mb * 1024 * 1024 // bytes_per_row))
+
+
+def tf_gene_correlation_blocks(ranked, tf_idx, memory_mb=1024, top_k=None, min_abs_rho=None):
+    """Yield (tf_idx, target_idx, rho) arrays for the full TF x gene Spearman matrix.
+
+    The matrix is computed one block of TFs at a time as a BLAS matrix multiply
+    of pre-ranked rows. For each TF only targets with |rho| >= `min_abs_rho`
+    and/or the `top_k` strongest targets are kept, ordered by decreasing |rho|.
+    Self edges and NaN correlations are never reported. Temporaries are released
+    as soon as they are used, so a block's peak memory stays within `memory_mb`.
+    """
+    tf_idx = np.asarray(tf_idx, dtype=np.int64)
+    ranks = ranked.ranks
+    n_genes = ranks.shape[0]
+    block_rows = block_rows_for_budget(n_genes, memory_mb, top_k, ranks.shape[1])
+    for start in range(0, len(tf_idx), block_rows):
+        block_tfs = tf_idx[start:start + block_rows]
+        rho = ranks[block_tfs] @ ranks.T
+        np.clip(rho, -1.0, 1.0, out=rho)
+        # -|rho|: the strongest targets come first in ascending order, dropped targets are +inf
+        score = np.abs(rho)
+        np.negative(score, out=score)
+        score[np.isnan(score)] = np.inf
+        score[np.arange(len(block_tfs)), block_tfs] = np.inf
+        if min_abs_rho is not None:
+            score[score > -min_abs_rho] = np.inf
+
+        if top_k is not None and top_k < n_genes:
+            cols = np.argpartition(score, top_k - 1, axis=1)[:, :top_k].copy()
+            picked = np.take_along_axis(score, cols, axis=1)
+            del score
+            order = np.argsort(picked, axis=1, kind='stable')
+            cols = np.take_along_axis(cols, order, axis=1)
+            picked = np.take_along_axis(picked, order, axis=1)
+            del order
+        else:
+            cols = np.argsort(score, axis=1, kind='stable')
+            picked = np.take_along_axis(score, cols, axis=1)
+            del score
+
+        keep = np.isfinite(picked)
+        del picked
+        rows, pos = np.nonzero(keep)
+        del keep
+        targets = cols[rows, pos]
+        del cols, pos
+        values = rho[rows, targets]
+        del rho
+        yield block_tfs[rows], targets, values
+        # The suspended generator would otherwise keep this block alive while computing the next one
+        del rows, targets, values
@@ -0,0 +1,65 @@
+"""
+@Author : shengtudai
+@Date : 2026-10-18 14:00:00
+@Description: Compute the full TF x gene Spearman correlation matrix and keep the strongest targets of each TF.
+@filename : tf_gene_spearman.py
+"""
+
+import argparse
+import pandas as pd
+from expression_cache import read_expression
+from spearman_engine import RankedExpression, load_tf_names, tf_gene_correlation_blocks
+
+"""
+python3 tf_gene_spearman.py -k [每个TF保留的靶基因数] -r [|rho|阈值] -m [内存上限MB] [msu_fpkm_expression.csv] [tf_list.txt] [输出文件名]
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compute all-vs-all TF x gene Spearman correlation and keep the '
+                                                 'top targets of each TF.')
+    parser.add_argument('-k', '--top-k', type=int, default=None, help='number of targets kept per TF')
+    parser.add_argument('-r', '--min-abs-rho', type=float, default=None, help='keep targets with |rho| >= this value')
+    parser.add_argument('-m', '--memory-mb', type=float, default=1024,
+                        help='peak memory for one block of the correlation matrix and its temporaries in MB '
+                             '(default: 1024)')
+    parser.add_argument('--cache', action='store_true',
+                        help='load the expression matrix through its float32 binary cache (built on first use)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory for expression cache files (default: next to the expression file)')
+    parser.add_argument('expression_file', type=str, help='input gene expression matrix file')
+    parser.add_argument('tf_file', type=str, help='transcription factor list file, one TF per line')
+    parser.add_argument('output_file', type=str, help='output file')
+    args = parser.parse_args()
+    if args.top_k is None and args.min_abs_rho is None:
+        parser.error('at least one of --top-k and --min-abs-rho is required')
+    return args
+
+
+def main():
+    args = parse_args()
+
+    expression_df = read_expression(args.expression_file, use_cache=args.cache, cache_dir=args.cache_dir)
+    ranked = RankedExpression(expression_df)
+    del expression_df
+    print(f"Loaded expression matrix: {len(ranked.genes)} genes.")
+
+    tf_names = [tf for tf in load_tf_names(args.tf_file) if tf in ranked.genes]
+    tf_idx = ranked.indices(tf_names)
+    print(f"Loaded {len(tf_names)} transcription factors present in the expression matrix.")
+
+    first = True
+    n_edges = 0
+    for tfs, targets, rho in tf_gene_correlation_blocks(ranked, tf_idx, memory_mb=args.memory_mb,
+                                                        top_k=args.top_k, min_abs_rho=args.min_abs_rho):
+        block_df = pd.DataFrame({'TF': ranked.genes[tfs], 'TG': ranked.genes[targets], 'Coor': rho})
+        block_df.to_csv(args.output_file, sep='\t', index=False, mode='w' if first else 'a', header=first)
+        first = False
+        n_edges += len(block_df)
+    if first:
+        pd.DataFrame(columns=['TF', 'TG', 'Coor']).to_csv(args.output_file, sep='\t', index=False)
+    print(f"calculate done, {n_edges} edges saved to {args.output_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Author: shengtudai
+@Date: 2026-10-18 18:32:00
+@Description: 并行运行cbust（每个TF一个任务），支持超时、重试和跳过已是最新的结果，并将所有结果汇总为一张表
+@filename: cbust_runner.py
+"""
+
+import os
+import re
+import glob
+import time
+import shlex
+import argparse
+import subprocess
+from multiprocessing import Pool
+
+import pandas as pd
+
+"""
+python cbust_runner.py -p 16 --cbust /path/to/cbust --cbust_args "-c 5 -m 6" -o cbust_results.tsv
+
+输入为cbust_seq_motif_generator.py生成的cbust_seqs/{tf}.fa和cbust_motifs/{tf}.cb，
+每个TF的原始输出保存在cbust_out/{tf}.txt。输出文件比两个输入都新时不再重新运行，只重新解析。
+
+解析的是cbust默认输出格式：
+    >基因名 ...
+    CLUSTER 1
+    Location: 起点 to 终点
+    Score: 得分
+    motif名  起点  终点  链  得分  [位点序列]
+结果表每行为一个motif位点，列为TF、Gene、Cluster、ClusterStart、ClusterEnd、ClusterScore、
+Motif、MotifStart、MotifEnd、Strand、MotifScore，按(TF, Gene)索引。输出文件以.parquet结尾时保存为parquet。
+"""
+
+RESULT_COLUMNS = ['TF', 'Gene', 'Cluster', 'ClusterStart', 'ClusterEnd', 'ClusterScore',
+                  'Motif', 'MotifStart', 'MotifEnd', 'Strand', 'MotifScore']
+
+HIT_PATTERN = re.compile(r'^\s*(\S+)\s+(\d+)\s+(\d+)\s+([+-])\s+(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)(?:\s+\S+)?\s*$')
+LOCATION_PATTERN = re.compile(r'^Location:\s*(\d+)\s+to\s+(\d+)')
+SCORE_PATTERN = re.compile(r'^Score:\s*(\S+)')
+
+
+def parse_cbust_output(tf, text):
+    """
+    解析单个TF的cbust输出，返回motif位点记录列表
+
+    :param tf: 转录因子名称
+    :type tf: str
+    :param text: cbust标准输出内容
+    :type text: str
+    :return: 每个motif位点一条记录，字段顺序同RESULT_COLUMNS
+    :rtype: list[tuple]
+    """
+    records = []
+    gene = None
+    cluster = None
+    for line in text.split('\n'):
+        if line.startswith('>'):
+            gene = line[1:].split()[0]
+            cluster = None
+        elif line.startswith('CLUSTER'):
+            cluster = [int(line.split()[1]), None, None, None]
+        elif cluster is not None and cluster[1] is None and LOCATION_PATTERN.match(line):
+            start, end = LOCATION_PATTERN.match(line).groups()
+            cluster[1], cluster[2] = int(start), int(end)
+        elif cluster is not None and cluster[3] is None and SCORE_PATTERN.match(line):
+            cluster[3] = float(SCORE_PATTERN.match(line).group(1))
+        elif cluster is not None and HIT_PATTERN.match(line):
+            motif, start, end, strand, score = HIT_PATTERN.match(line).groups()
+            records.append((tf, gene, *cluster, motif, int(start), int(end), strand, float(score)))
+    return records
+
+
+def is_up_to_date(out_file, inputs):
+    """输出文件存在且比所有输入都新"""
+    if not os.path.exists(out_file):
+        return False
+    out_mtime = os.path.getmtime(out_file)
+    return all(os.path.getmtime(path) <= out_mtime for path in inputs)
+
+
+def run_cbust(task):
+    """
+    运行单个TF的cbust任务（在进程池中执行），失败或超时时按次数重试
+
+    :return: (tf, 状态, 尝试次数, 耗时, 错误信息, 解析出的记录)
+    """
+    tf, seq_file, motif_file, out_file, cbust, cbust_args, timeout, retries = task
+    start = time.time()
+    status, attempts, error = 'skipped', 0, ''
+    if not is_up_to_date(out_file, [seq_file, motif_file]):
+        status = 'failed'
+        while attempts <= retries:
+            attempts += 1
+            try:
+                with open(out_file + '.tmp', 'w') as out:
+                    proc = subprocess.run([cbust, *cbust_args, motif_file, seq_file], stdout=out,
+                                          stderr=subprocess.PIPE, timeout=timeout, text=True)
+                if proc.returncode == 0:
+                    os.replace(out_file + '.tmp', out_file)
+                    status, error = 'ok', ''
+                    break
+                error = f"exit code {proc.returncode}: {proc.stderr.strip()[-200:]}"
+            except subprocess.TimeoutExpired:
+                error = f"timeout after {timeout}s"
+            except OSError as e:
+                error = str(e)
+                break
+        if status != 'ok' and os.path.exists(out_file + '.tmp'):
+            os.remove(out_file + '.tmp')
+
+    records = []
+    if status != 'failed':
+        with open(out_file, 'r') as f:
+            records = parse_cbust_output(tf, f.read())
+    return tf, status, attempts, time.time() - start, error, records
+
+
+def collect_tasks(args):
+    """找出同时有序列文件和motif文件的TF"""
+    tasks = []
+    for seq_file in sorted(glob.glob(os.path.join(args.seq_dir, '*.fa'))):
+        tf = os.path.basename(seq_file)[:-len('.fa')]
+        motif_file = os.path.join(args.motif_dir, f"{tf}.cb")
+        if not os.path.exists(motif_file):
+            print(f"{motif_file} not exists, skip {tf}")
+            continue
+        out_file = os.path.join(args.out_dir, f"{tf}.txt")
+        tasks.append((tf, seq_file, motif_file, out_file, args.cbust, shlex.split(args.cbust_args),
+                      args.timeout, args.retries))
+    return tasks
+
+
+def save_results(records, out_file):
+    df = pd.DataFrame(records, columns=RESULT_COLUMNS).set_index(['TF', 'Gene'])
+    if out_file.endswith('.parquet'):
+        df.to_parquet(out_file)
+    else:
+        df.to_csv(out_file, sep='\t')
+    return df
+
+
+def main(args):
+    os.makedirs(args.out_dir, exist_ok=True)
+    tasks = collect_tasks(args)
+
+    records = []
+    counts = {}
+    with Pool(processes=args.processes) as pool, open(args.report, 'w') as report:
+        report.write("TF\tstatus\tattempts\tseconds\thits\terror\n")
+        for tf, status, attempts, seconds, error, tf_records in pool.imap(run_cbust, tasks):
+            counts[status] = counts.get(status, 0) + 1
+            if status == 'failed':
+                print(f"cbust failed for {tf}: {error}")
+            records += tf_records
+            report.write(f"{tf}\t{status}\t{attempts}\t{seconds:.2f}\t{len(tf_records)}\t{error}\n")
+
+    df = save_results(records, args.outfile)
+    summary = ', '.join(f"{status}: {n}" for status, n in sorted(counts.items()))
+    print(f"{len(tasks)} TFs ({summary}), {len(df)} motif hits saved to {args.outfile}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run cbust for every TF in parallel and merge the results.')
+    parser.add_argument('--cbust', default='cbust', help='Path of the cbust executable.')
+    parser.add_argument('--cbust_args', default='', help='Extra cbust options, e.g. "-c 5 -m 6".')
+    parser.add_argument('--seq_dir', default='cbust_seqs', help='Directory of {tf}.fa sequence files.')
+    parser.add_argument('--motif_dir', default='cbust_motifs', help='Directory of {tf}.cb motif files.')
+    parser.add_argument('--out_dir', default='cbust_out', help='Directory for raw cbust outputs.')
+    parser.add_argument('--processes', '-p', type=int, default=1, help='Number of cbust jobs run at the same time.')
+    parser.add_argument('--timeout', type=float, default=None, help='Timeout of one cbust run in seconds.')
+    parser.add_argument('--retries', type=int, default=1, help='Retries after a failed or timed out run.')
+    parser.add_argument('--report', default='cbust_run_report.tsv', help='Per-TF run report.')
+    parser.add_argument('--outfile', '-o', default='cbust_results.tsv',
+                        help='Merged result table (.tsv, or .parquet for a parquet file).')
+    args = parser.parse_args()
+
+    # 输出程序开始运行信息
+    print("=" * 40)
+    print("Starting program...")
+    print(f"cbust: {args.cbust} {args.cbust_args}")
+    print(f"Processes: {args.processes}")
+    print(f"Output file: {args.outfile}")
+    print("=" * 40)
+
+    main(args)
+
+    # 输出程序结束信息
+    print("=" * 40)
+    print("Program finished.")
+    print("=" * 40)
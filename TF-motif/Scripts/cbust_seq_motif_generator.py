@@ -4,13 +4,33 @@
 # @filename: cbust_seq_motif_generator.py
 
 import os
+import sys
+import mmap
+import time
 import argparse
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'RNA-Seq', 'Scripts'))
+from regulon_store import RegulonStore
+from motif_library import MotifLibrary
+from rice_gene_id_converter import IDConverter
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Generate sequence and motif files for cbust')
     parser.add_argument('--promoter_file', type=str, required=True, help='The path of input promoter file')
     parser.add_argument('--tf2motif_file', type=str, required=True, help='The path of input TF-to-motif file')
+    parser.add_argument('--regulon_store', type=str, default=None,
+                        help='Read regulons from this single-file store instead of regulons/{tf}.txt')
+    parser.add_argument('--motif_library', type=str, default=None,
+                        help='Read PWMs from this binary motif library instead of cbpwms/{motif}.txt')
+    parser.add_argument('--id_map', type=str, default=None,
+                        help='RAP-MSU.txt mapping used to convert regulon gene IDs to the promoter file IDs')
+    parser.add_argument('--convert', choices=['rap2msu', 'msu2rap'], default='msu2rap',
+                        help='Direction of the regulon ID conversion with --id_map (default: msu2rap)')
+    parser.add_argument('--processes', '-p', type=int, default=1, help='Number of TFs processed in parallel')
+    parser.add_argument('--report', type=str, default='cbust_generation_report.tsv',
+                        help='Per-TF status, sequence count and timing report')
     return parser.parse_args()
 
 
@@ -27,6 +47,75 @@ def read_promoter_file(file_path):
     return prmt_dict
 
 
+class PromoterIndex:
+    """
+    启动子FASTA的持久化偏移索引，按基因ID通过mmap按需读取序列，用法与read_promoter_file返回的字典相同
+
+    索引保存在{fasta}.gidx中：第一行记录FASTA的mtime和大小，之后每行为基因ID、序列起始字节偏移、字节长度。
+    FASTA的mtime或大小变化时自动重建索引。
+    """
+
+    def __init__(self, file_path, offsets=None):
+        # offsets为主进程已经建立好的索引，传入时直接使用，不再读取或重建.gidx
+        self.file_path = file_path
+        self.index_path = file_path + '.gidx'
+        stat = os.stat(file_path)
+        self.stamp = f"#{stat.st_mtime_ns}\t{stat.st_size}"
+        self.offsets = offsets if offsets is not None else self._load_index()
+        if self.offsets is None:
+            self.offsets = self._build_index()
+        self._file = open(file_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return None
+        with open(self.index_path, 'r') as f:
+            if f.readline().rstrip('\n') != self.stamp:
+                return None
+            offsets = {}
+            for line in f:
+                name, offset, length = line.rstrip('\n').split('\t')
+                offsets[name] = (int(offset), int(length))
+        return offsets
+
+    def _build_index(self):
+        # 与read_promoter_file一致：序列名为'>'后第一个空格前的部分，重复的名称以最后一条为准
+        offsets = {}
+        name, start, pos = None, 0, 0
+        with open(self.file_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'>'):
+                    if name is not None:
+                        offsets[name] = (start, pos - start)
+                    name = line[1:].rstrip(b'\r\n').decode().split(' ')[0]
+                    start = pos + len(line)
+                pos += len(line)
+        if name is not None:
+            offsets[name] = (start, pos - start)
+        try:
+            with open(self.index_path + '.tmp', 'w') as f:
+                f.write(self.stamp + '\n')
+                f.writelines(f"{name}\t{offset}\t{length}\n" for name, (offset, length) in offsets.items())
+            os.replace(self.index_path + '.tmp', self.index_path)
+        except OSError as e:
+            print(f"Cannot save promoter index {self.index_path}: {e}")
+        return offsets
+
+    def __contains__(self, gene):
+        return gene in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, gene):
+        offset, length = self.offsets[gene]
+        return self._mm[offset:offset + length].replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def get(self, gene, default=None):
+        return self[gene] if gene in self.offsets else default
+
+
 def read_tf2motif_file(file_path):
     with open(file_path, 'r') as f:
         content = f.read()
@@ -35,18 +124,34 @@ def read_tf2motif_file(file_path):
     return tf2motif
 
 
-def generate_seq(tf, prmt_dict):
-    if not os.path.exists("cbust_seqs"):
-        os.mkdir("cbust_seqs")
+def read_regulon(tf, regulon_store=None):
+    # 从regulon存储或regulons/{tf}.txt读取靶基因，不存在时返回None
+    if regulon_store is not None:
+        if tf not in regulon_store:
+            print(f"{tf} not in {regulon_store.path}")
+            return None
+        return regulon_store.genes(tf)
 
     # 判断regulons/{tf}.tsv是否存在
     file_path = f"regulons/{tf}.txt"
     if not os.path.exists(file_path):
         print(f"{file_path} not exists")
-        return False
+        return None
 
     with open(file_path, "r") as f:
-        gene_set = [x.replace("OS", "Os").replace("G", "g") for x in f.read().split('\n') if x != '']
+        return [x for x in f.read().split('\n') if x != '']
+
+
+def generate_seq(tf, prmt_dict, regulon_store=None, id_converter=None):
+    # 返回写入的序列数，regulon不存在时返回None；输出目录由main统一创建
+    genes = read_regulon(tf, regulon_store)
+    if genes is None:
+        return None
+    gene_set = [x.replace("OS", "Os").replace("G", "g") for x in genes]
+    if id_converter is not None:
+        # 一次转换整个regulon，一对多时保留所有对应ID，没有对应ID的基因去掉
+        converted = id_converter.convert_lists(gene_set)
+        gene_set = list(dict.fromkeys(x for ids in converted if ids for x in ids if x != "None"))
 
     seqs = []
     for gene in gene_set:
@@ -57,37 +162,112 @@ def generate_seq(tf, prmt_dict):
     if seqs:
         with open(f"cbust_seqs/{tf}.fa", "w") as f:
             f.writelines(seqs)
-        return True
-    else:
-        return False
+    return len(seqs)
+
+
+def read_motif_lines(motif, motif_library=None):
+    if motif_library is not None:
+        return motif_library.text_lines(motif)
+    with open(f"cbpwms/{motif}.txt", "r") as f:
+        content = f.read()
+    return [line + '\n' for line in content.split('\n') if line.strip()]
+
 
+def load_motif_cache(tf2motif, motif_library=None):
+    # 每个PWM文件（或PWM库中的motif）只读取一次，缺失的motif记录下来并在生成时跳过
+    cache = {}
+    missing = set()
+    for _, motifs in tf2motif:
+        for motif in motifs.split(','):
+            if motif in cache or motif in missing:
+                continue
+            try:
+                cache[motif] = read_motif_lines(motif, motif_library)
+            except (FileNotFoundError, KeyError):
+                missing.add(motif)
+    if missing:
+        source = motif_library.path if motif_library is not None else 'cbpwms/'
+        print(f"{len(missing)} motifs not found in {source}, skipped: {','.join(sorted(missing)[:10])}")
+    return cache
 
-def generate_motif(motifs):
-    # 拼接多个motif文件
-    if not os.path.exists("cbust_motifs"):
-        os.mkdir("cbust_motifs")
-    motif_files = [f"cbpwms/{motif}.txt" for motif in motifs]
+
+def generate_motif(motifs, motif_cache=None):
+    # 拼接多个motif文件，提供motif_cache时直接使用缓存内容
     motif_content = []
-    for motif_file in motif_files:
-        with open(motif_file, "r") as f:
-            content = f.read()
-        motif_content += content.split('\n')
-    motif_content = [line + '\n' for line in motif_content if line.strip()]
+    for motif in motifs:
+        if motif_cache is None:
+            motif_content += read_motif_lines(motif)
+        elif motif in motif_cache:
+            motif_content += motif_cache[motif]
     return motif_content
 
 
-def main(args):
-    prmt_dict = read_promoter_file(args.promoter_file)
-    tf2motif = read_tf2motif_file(args.tf2motif_file)
+_worker_state = {}
+
+
+def init_worker(promoter_file, regulon_store_path, motif_cache, id_map=None, convert='msu2rap',
+                promoter_offsets=None):
+    # 启动子索引由主进程建立后传入，每个进程只打开自己的mmap；motif缓存在进程启动时传入一次，ID对应关系从编译好的缓存读取
+    _worker_state['prmt_dict'] = PromoterIndex(promoter_file, promoter_offsets)
+    _worker_state['regulon_store'] = RegulonStore(regulon_store_path) if regulon_store_path else None
+    _worker_state['motif_cache'] = motif_cache
+    _worker_state['id_converter'] = IDConverter.from_file(id_map, convert) if id_map else None
+
 
-    for tf, motifs in tf2motif:
-        flag = generate_seq(tf, prmt_dict)
-        if flag:
-            motif_content = generate_motif(motifs.split(','))
+def process_tf(task):
+    tf, motifs = task
+    start = time.time()
+    n_seqs = generate_seq(tf, _worker_state['prmt_dict'], _worker_state['regulon_store'],
+                          _worker_state['id_converter'])
+    if n_seqs is None:
+        status = 'no_regulon'
+    elif n_seqs == 0:
+        status = 'no_sequences'
+    else:
+        motif_content = generate_motif(motifs.split(','), _worker_state['motif_cache'])
+        if motif_content:
             with open(f"cbust_motifs/{tf}.cb", "w") as f:
                 f.writelines(motif_content)
+            status = 'ok'
         else:
-            print(f"No sequences generated for {tf}")
+            status = 'no_motifs'
+    return tf, status, n_seqs or 0, time.time() - start
+
+
+def main(args):
+    start = time.time()
+    tf2motif = read_tf2motif_file(args.tf2motif_file)
+    motif_library = MotifLibrary(args.motif_library) if args.motif_library else None
+    motif_cache = load_motif_cache(tf2motif, motif_library)
+    os.makedirs("cbust_seqs", exist_ok=True)
+    os.makedirs("cbust_motifs", exist_ok=True)
+    tasks = [(tf, motifs) for tf, motifs in tf2motif]
+    if args.id_map:
+        # 在主进程中编译一次对应关系，各进程直接读取缓存
+        IDConverter.from_file(args.id_map, args.convert)
+
+    # 启动子只建立偏移索引，序列在生成cbust输入时按需读取；索引在主进程中建立一次，避免各进程重复扫描FASTA
+    promoter_offsets = PromoterIndex(args.promoter_file).offsets
+    initargs = (args.promoter_file, args.regulon_store, motif_cache, args.id_map, args.convert, promoter_offsets)
+    if args.processes > 1:
+        with Pool(processes=args.processes, initializer=init_worker, initargs=initargs) as pool:
+            results = pool.map(process_tf, tasks, chunksize=max(1, len(tasks) // (args.processes * 8)))
+    else:
+        init_worker(*initargs)
+        results = [process_tf(task) for task in tasks]
+
+    counts = {}
+    with open(args.report, "w") as f:
+        f.write("TF\tstatus\tsequences\tseconds\n")
+        for tf, status, n_seqs, seconds in results:
+            counts[status] = counts.get(status, 0) + 1
+            if status == 'no_motifs':
+                print(f"No motif files found for {tf}")
+            elif status != 'ok':
+                print(f"No sequences generated for {tf}")
+            f.write(f"{tf}\t{status}\t{n_seqs}\t{seconds:.4f}\n")
+    summary = ', '.join(f"{status}: {n}" for status, n in sorted(counts.items()))
+    print(f"{len(results)} TFs processed in {time.time() - start:.1f}s ({summary}), report saved to {args.report}")
 
 
 if __name__ == '__main__':
@@ -8,11 +8,12 @@
 @filename: clean_motif.py
 """
 
-import os
 import argparse
+from motif_library import MotifLibrary
+from motif_manifest import MotifManifest
 
 
-def clean_motif_file(infile, out_file, pwm_dir):
+def clean_motif_file(infile, out_file, pwm_dir=None, library=None, manifest=None, rescan=False):
     """
     从输入文件中删除不存在的PWM文件，同时将PWM文件名后缀去掉
 
@@ -22,9 +23,18 @@ def clean_motif_file(infile, out_file, pwm_dir):
     :type out_file: str
     :param pwm_dir: 包含PWM文件的目录路径
     :type pwm_dir: str
+    :param library: PWM库路径（motif_library.py），提供时从库的索引中获取motif名称
+    :type library: str
+    :param manifest: PWM目录清单的路径，默认保存在PWM目录旁边
+    :type manifest: str
+    :param rescan: 是否重新获取所有PWM文件的大小和修改时间
+    :type rescan: bool
     """
-    # 获取所有PWM文件的名称
-    motifs = [x.replace(".txt", "") for x in os.listdir(pwm_dir)]
+    # 获取所有PWM文件的名称，目录未变化时直接使用清单，不再列出目录
+    if library is not None:
+        motifs = set(MotifLibrary(library).index)
+    else:
+        motifs = MotifManifest(pwm_dir, manifest, rescan)
 
     # 读取输入文件内容
     with open(infile, "r") as f:
@@ -57,23 +67,29 @@ if __name__ == '__main__':
 
     # 添加命令行参数
     parser.add_argument('infile', help='Input file containing TF names and motif names.')
-    parser.add_argument('pwm_dir', help='Directory containing PWM files.')
+    parser.add_argument('pwm_dir', nargs='?', help='Directory containing PWM files.')
+    parser.add_argument('--library', help='Binary motif library (motif_library.py) used instead of pwm_dir.')
+    parser.add_argument('--manifest', help='Manifest of pwm_dir (default: next to pwm_dir, see motif_manifest.py).')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Rescan pwm_dir even if its mtime is unchanged (e.g. after rewriting PWM files in place).')
     parser.add_argument('--outfile', '-o', help='Output file to store the cleaned TF-motif pairs.',
                         default='TF2motif_clean.txt')
 
     # 解析命令行参数
     args = parser.parse_args()
+    if not args.pwm_dir and not args.library:
+        parser.error('either pwm_dir or --library is required')
 
     # 输出程序开始运行信息
     print("=" * 40)
     print("Starting program...")
     print(f"Input file: {args.infile}")
-    print(f"PWM directory: {args.pwm_dir}")
+    print(f"PWM directory: {args.pwm_dir}" if not args.library else f"Motif library: {args.library}")
     print(f"Output file: {args.outfile}")
     print("=" * 40)
 
     # 执行函数
-    clean_motif_file(args.infile, args.outfile, args.pwm_dir)
+    clean_motif_file(args.infile, args.outfile, args.pwm_dir, args.library, args.manifest, args.rescan)
 
     # 输出程序结束信息
     print("=" * 40)
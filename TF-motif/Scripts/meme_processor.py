@@ -6,8 +6,27 @@
 """
 import argparse
 import os
-import pandas as pd
-from typing import List
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from motif_library import MotifLibraryWriter
+
+"""
+python meme_processor.py [meme目录] -o cbpwms -p 8
+python meme_processor.py [meme目录] --library motifs.lib -p 8
+
+每个.meme文件可以包含多个MOTIF，每个motif使用自己的letter-probability matrix；
+文件名（不含后缀）作为TF名称，regulons.txt中每行为 TF\tmotif1,motif2,...
+"""
+
+
+class MemeMotif(NamedTuple):
+    """MEME文件中的一个motif"""
+    name: str                   # 输出使用的名称：有替代名称时为替代名称，否则为motif ID
+    motif_id: str
+    alt_name: Optional[str]
+    matrix: List[List[float]]   # letter-probability matrix，每行A、C、G、T
+    metadata: Dict[str, str]    # letter-probability matrix行中的alength、w、nsites、E等
 
 
 def parse_args() -> argparse.Namespace:
@@ -15,6 +34,10 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Process MEME files.')
     parser.add_argument('input_dir', type=str, help='the directory containing .meme files')
     parser.add_argument('--output_dir', '-o', type=str, default='./', help='the directory to save output files')
+    parser.add_argument('--library', type=str, default=None,
+                        help='write all motifs into this binary motif library instead of one .txt per motif')
+    parser.add_argument('--regulons', type=str, default='regulons.txt', help='the TF-to-motif output file')
+    parser.add_argument('--processes', '-p', type=int, default=1, help='number of .meme files parsed in parallel')
 
     args = parser.parse_args()
 
@@ -22,37 +45,80 @@ def parse_args() -> argparse.Namespace:
 
 
 def get_tf_names(input_dir: str) -> List[str]:
-    """获取输入目录中所有.meme文件的文件名（不含后缀）"""
+    """获取输入目录中所有.meme文件的文件名（不含后缀），按名称排序"""
     tf_names = [os.path.splitext(file)[0] for file in os.listdir(input_dir) if file.endswith('.meme')]
-    return tf_names
+    return sorted(tf_names)
 
 
-def process_meme_file(meme_file_path: str, output_dir: str) -> str:
-    """处理单个meme文件，并返回输出文件的内容"""
-    # 读取文件内容
-    with open(meme_file_path, 'r') as f:
-        content = f.readlines()
-
-    # 提取motif和pandas矩阵
-    motif = None
-    matrix_rows = []
-    for line in content:
-        if line.startswith('MOTIF'):
-            motif = line.split()[2]
-        elif len(line.split()) == 4:
-            matrix_rows.append(list(map(lambda x: float(x) * 100, line.split())))
-
-    # 将矩阵转换为pandas数据帧
-    df = pd.DataFrame(matrix_rows)
+def parse_metadata(line: str) -> Dict[str, str]:
+    """解析'letter-probability matrix: alength= 4 w= 10 nsites= 20 E= 0'中的键值对"""
+    tokens = line.split(':', 1)[1].replace('= ', '=').split()
+    return dict(token.split('=', 1) for token in tokens if '=' in token)
 
-    # 构造输出文件内容
-    output_content = '>' + motif + '\n' + df.to_csv(sep='\t', header=False, index=False)
 
-    # 写入输出文件
-    with open(os.path.join(output_dir, motif + '.txt'), 'w') as f:
-        f.write(output_content)
+def iter_meme_motifs(meme_file_path: str) -> Iterator[MemeMotif]:
+    """逐行读取MEME文件，依次返回其中的每个motif
 
-    return motif
+    矩阵只从letter-probability matrix行之后读取，读满w行或遇到非数值行时结束，
+    因此背景频率等其他四列数值行不会混入矩阵。
+    """
+    motif_id = alt_name = None
+    matrix, metadata = [], {}
+    in_matrix = False
+    width = None
+    with open(meme_file_path, 'r') as f:
+        for line in f:
+            tokens = line.split()
+            if line.startswith('MOTIF'):
+                if motif_id is not None and matrix:
+                    yield MemeMotif(alt_name or motif_id, motif_id, alt_name, matrix, metadata)
+                motif_id = tokens[1]
+                alt_name = tokens[2] if len(tokens) > 2 else None
+                matrix, metadata = [], {}
+                in_matrix = False
+            elif motif_id is not None and line.startswith('letter-probability matrix'):
+                metadata = parse_metadata(line)
+                width = int(metadata['w']) if metadata.get('w', '').isdigit() else None
+                in_matrix = True
+            elif in_matrix:
+                if not tokens and not matrix:
+                    continue
+                try:
+                    row = [float(x) for x in tokens]
+                except ValueError:
+                    row = []
+                if len(row) != 4:
+                    in_matrix = False
+                    continue
+                matrix.append(row)
+                if width is not None and len(matrix) == width:
+                    in_matrix = False
+    if motif_id is not None and matrix:
+        yield MemeMotif(alt_name or motif_id, motif_id, alt_name, matrix, metadata)
+
+
+def process_meme_file(meme_file_path: str) -> List[Tuple[str, List[List[float]]]]:
+    """处理单个meme文件，返回其中每个motif的名称和放大100倍后的矩阵"""
+    return [(motif.name, [[x * 100 for x in row] for row in motif.matrix])
+            for motif in iter_meme_motifs(meme_file_path)]
+
+
+def format_motif_text(motif: str, matrix: List[List[float]]) -> str:
+    """构造{motif}.txt的内容：首行>motif名称，之后每行4个制表符分隔的数值"""
+    return '>' + motif + '\n' + ''.join('\t'.join(map(repr, row)) + '\n' for row in matrix)
+
+
+def write_motifs(motifs: Dict[str, List[List[float]]], output_dir: str, library: Optional[str]) -> None:
+    """一次性写出所有motif：写入PWM库，或在output_dir下为每个motif写一个{motif}.txt"""
+    if library is not None:
+        with MotifLibraryWriter(library) as writer:
+            for motif, matrix in motifs.items():
+                writer.add(motif, matrix)
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    for motif, matrix in motifs.items():
+        with open(os.path.join(output_dir, motif + '.txt'), 'w') as f:
+            f.write(format_motif_text(motif, matrix))
 
 
 def main() -> None:
@@ -62,15 +128,34 @@ def main() -> None:
 
     # 获取输入目录中所有.meme文件的文件名（不含后缀）
     tf_names = get_tf_names(args.input_dir)
-
-    regulons_content = ''
-    # 处理每个.meme文件，并保存结果
-    for tf_name in tf_names:
-        motif = process_meme_file(os.path.join(args.input_dir, tf_name + '.meme'), args.output_dir)
-        regulons_content += tf_name + '\t' + motif + '\n'
-
-    with open('regulons.txt', 'w') as f:
-        f.write(regulons_content)
+    paths = [os.path.join(args.input_dir, tf_name + '.meme') for tf_name in tf_names]
+
+    # 并行解析每个.meme文件，结果按文件顺序汇总
+    with Pool(processes=args.processes) as pool:
+        results = pool.imap(process_meme_file, paths, chunksize=max(1, len(paths) // (args.processes * 8)))
+        motifs = {}
+        regulons_content = []
+        n_duplicates = 0
+        for tf_name, file_motifs in zip(tf_names, results):
+            if not file_motifs:
+                print(f"No motif found in {tf_name}.meme")
+                continue
+            for motif, matrix in file_motifs:
+                if motif in motifs:
+                    n_duplicates += 1
+                    continue
+                motifs[motif] = matrix
+            names = list(dict.fromkeys(motif for motif, _ in file_motifs))
+            regulons_content.append(tf_name + '\t' + ','.join(names) + '\n')
+
+    if n_duplicates:
+        print(f"{n_duplicates} motifs appear in more than one file, only the first matrix is kept")
+    write_motifs(motifs, args.output_dir, args.library)
+
+    with open(args.regulons, 'w') as f:
+        f.writelines(regulons_content)
+    print(f"{len(motifs)} motifs from {len(regulons_content)} of {len(tf_names)} files, "
+          f"TF-to-motif pairs saved to {args.regulons}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Author: shengtudai
+@Date: 2026-10-18 18:40:00
+@Description: 单文件二进制PWM库：所有矩阵连续保存为float32数组，加一个按motif名称索引的偏移表，代替cbpwms/下的{motif}.txt
+@filename: motif_library.py
+"""
+
+import os
+import argparse
+import numpy as np
+
+"""
+python motif_library.py pack cbpwms motifs.lib                 # 将已有的{motif}.txt目录打包为PWM库
+python motif_library.py export motifs.lib cbpwms               # 导出为每个motif一个{motif}.txt的目录
+python motif_library.py cb motifs.lib TF2motif.txt cbust_motifs  # 按TF→motif文件为每个TF导出{tf}.cb
+
+PWM库由两个文件组成：
+    motifs.lib      所有PWM按行首尾相接，每行A、C、G、T四个float32值（小端）
+    motifs.lib.idx  制表符分隔的索引：motif名称、起始行号、行数（PWM长度）
+读取时通过np.memmap映射整个数组，按索引切片即可得到PWM，不需要逐个打开和解析文本文件。
+导出的文本格式与meme_processor.py写出的{motif}.txt相同（首行>motif名称，之后每行4个制表符分隔的数值），
+cbust的.cb文件即为多个这样的文本首尾相接。
+"""
+
+INDEX_SUFFIX = '.idx'
+DTYPE = np.dtype('<f4')
+
+
+def read_text_motif(motif_file):
+    """读取{motif}.txt文本格式的PWM，与remove_duplicate_pwm.load_motif的解析方式相同"""
+    with open(motif_file, 'r') as f:
+        return [list(map(float, line.split())) for line in f if line.strip() and not line.startswith('>')]
+
+
+def format_motif(name, pwm):
+    """PWM的文本格式（按行返回），数值取能还原float32的最短表示"""
+    return [f">{name}\n"] + ['\t'.join(str(DTYPE.type(x)) for x in row) + '\n' for row in pwm]
+
+
+class MotifLibraryWriter:
+    """顺序写入PWM库，每个motif只能写入一次"""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = open(path + '.tmp', 'wb')
+        self._index = []
+        self._seen = set()
+        self._offset = 0
+
+    def add(self, name, pwm):
+        if name in self._seen:
+            raise ValueError(f"motif {name} 已写入PWM库")
+        arr = np.asarray(pwm, dtype=DTYPE).reshape(-1, 4)
+        self._seen.add(name)
+        self._data.write(arr.tobytes())
+        self._index.append(f"{name}\t{self._offset}\t{len(arr)}\n")
+        self._offset += len(arr)
+
+    def close(self):
+        self._data.close()
+        with open(self.path + INDEX_SUFFIX + '.tmp', 'w') as f:
+            f.writelines(self._index)
+        os.replace(self.path + '.tmp', self.path)
+        os.replace(self.path + INDEX_SUFFIX + '.tmp', self.path + INDEX_SUFFIX)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._data.close()
+
+
+class MotifLibrary:
+    """通过mmap读取PWM库，按motif名称取出(长度, 4)的float32矩阵"""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        with open(path + INDEX_SUFFIX) as f:
+            for line in f:
+                name, offset, length = line.rstrip('\n').split('\t')
+                self.index[name] = (int(offset), int(length))
+        if os.path.getsize(path):
+            self.data = np.memmap(path, dtype=DTYPE, mode='r').reshape(-1, 4)
+        else:
+            self.data = np.zeros((0, 4), dtype=DTYPE)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def matrix(self, name):
+        """motif的PWM（只读视图），motif不存在时抛出KeyError"""
+        offset, length = self.index[name]
+        return self.data[offset:offset + length]
+
+    def pwm(self, name):
+        """motif的PWM，格式与load_motif返回的嵌套列表相同"""
+        return self.matrix(name).astype(np.float64).tolist()
+
+    def text_lines(self, name):
+        """motif的{motif}.txt文本内容（按行）"""
+        return format_motif(name, self.matrix(name))
+
+
+def pack_directory(src_dir, library_path):
+    """将{motif}.txt目录打包为PWM库，按motif名称排序写入"""
+    names = sorted(x[:-len('.txt')] for x in os.listdir(src_dir) if x.endswith('.txt'))
+    with MotifLibraryWriter(library_path) as writer:
+        for name in names:
+            writer.add(name, read_text_motif(os.path.join(src_dir, name + '.txt')))
+    return len(names)
+
+
+def export_directory(library_path, dest_dir):
+    """将PWM库导出为每个motif一个{motif}.txt文件的目录"""
+    os.makedirs(dest_dir, exist_ok=True)
+    library = MotifLibrary(library_path)
+    for name in library:
+        with open(os.path.join(dest_dir, name + '.txt'), 'w') as f:
+            f.writelines(library.text_lines(name))
+    return len(library)
+
+
+def export_cb(library_path, tf2motif_file, dest_dir):
+    """按TF→motif文件为每个TF导出cbust的{tf}.cb文件，库中不存在的motif跳过"""
+    os.makedirs(dest_dir, exist_ok=True)
+    library = MotifLibrary(library_path)
+    n = 0
+    with open(tf2motif_file, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            tf, motifs = line.strip().split('\t')
+            content = []
+            for motif in motifs.split(','):
+                if motif in library:
+                    content += library.text_lines(motif)
+            if content:
+                with open(os.path.join(dest_dir, f"{tf}.cb"), 'w') as out:
+                    out.writelines(content)
+                n += 1
+    return n
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pack PWM text files into a binary motif library and export it.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help='Pack a directory of {motif}.txt files into a library.')
+    pack_parser.add_argument('src_dir', help='Directory containing {motif}.txt PWM files.')
+    pack_parser.add_argument('library', help='Output motif library path.')
+    export_parser = subparsers.add_parser('export', help='Export a library to a directory of {motif}.txt files.')
+    export_parser.add_argument('library', help='Motif library path.')
+    export_parser.add_argument('dest_dir', help='Output directory.')
+    cb_parser = subparsers.add_parser('cb', help='Write one cbust {tf}.cb file per TF of a TF-to-motif file.')
+    cb_parser.add_argument('library', help='Motif library path.')
+    cb_parser.add_argument('tf2motif_file', help='TF-to-motif file (TF<TAB>motif1,motif2).')
+    cb_parser.add_argument('dest_dir', help='Output directory.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'pack':
+        n = pack_directory(args.src_dir, args.library)
+        print(f"Packed {n} motifs into {args.library}")
+    elif args.command == 'export':
+        n = export_directory(args.library, args.dest_dir)
+        print(f"Exported {n} motifs to {args.dest_dir}")
+    else:
+        n = export_cb(args.library, args.tf2motif_file, args.dest_dir)
+        print(f"Wrote {n} cbust motif files to {args.dest_dir}")
+
+
+if __name__ == '__main__':
+    main()
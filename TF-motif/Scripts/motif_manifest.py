@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+@Author: shengtudai
+@Date: 2026-10-18 18:41:00
+@Description: PWM目录的持久化清单：保存目录中所有{motif}.txt的名称、大小和修改时间，目录未变化时不再列出目录
+@filename: motif_manifest.py
+"""
+
+import os
+import argparse
+
+"""
+python motif_manifest.py cbpwms              # 建立或增量更新cbpwms.manifest并输出motif个数
+python motif_manifest.py cbpwms --rescan     # 目录未变化时也强制重新扫描
+
+清单默认保存在PWM目录旁边（cbpwms/ -> cbpwms.manifest），写入清单不会改变PWM目录本身的修改时间。
+第一行记录PWM目录的修改时间，之后每行为motif名称、文件大小、文件修改时间（纳秒）。
+目录的修改时间未变化时直接使用清单，不列出目录也不调用stat；变化时重新列出目录并获取所有文件的大小和修改时间。
+注意：原地改写已有的PWM文件不会改变目录的修改时间，这种情况下需要--rescan才能更新大小和修改时间。
+"""
+
+SUFFIX = '.txt'
+
+
+def default_manifest_path(pwm_dir):
+    return os.path.normpath(pwm_dir) + '.manifest'
+
+
+class MotifManifest:
+    """PWM目录中可用motif的集合（含每个文件的大小和修改时间），成员判断为O(1)"""
+
+    def __init__(self, pwm_dir, path=None, rescan=False):
+        self.pwm_dir = pwm_dir
+        self.path = path or default_manifest_path(pwm_dir)
+        self.stamp = f"#{os.stat(pwm_dir).st_mtime_ns}"
+        self.entries, stamp = self._load()
+        if rescan or stamp != self.stamp:
+            self._refresh()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}, None
+        entries = {}
+        with open(self.path, 'r') as f:
+            stamp = f.readline().rstrip('\n')
+            for line in f:
+                name, size, mtime = line.rstrip('\n').split('\t')
+                entries[name] = (int(size), int(mtime))
+        return entries, stamp
+
+    def _refresh(self):
+        entries = {}
+        with os.scandir(self.pwm_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                stat = entry.stat()
+                entries[entry.name[:-len(SUFFIX)]] = (stat.st_size, stat.st_mtime_ns)
+        n_new = len(set(entries) - set(self.entries))
+        n_removed = len(set(self.entries) - set(entries))
+        n_changed = sum(1 for name, value in entries.items() if name in self.entries and self.entries[name] != value)
+        self.entries = entries
+        print(f"Motif manifest {self.path} updated: {len(entries)} motifs "
+              f"({n_new} new, {n_changed} changed, {n_removed} removed)")
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                f.write(self.stamp + '\n')
+                f.writelines(f"{name}\t{size}\t{mtime}\n" for name, (size, mtime) in sorted(entries.items()))
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f"Cannot save motif manifest {self.path}: {e}")
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def motif_path(self, name):
+        return os.path.join(self.pwm_dir, name + SUFFIX)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or refresh the manifest of a PWM directory.')
+    parser.add_argument('pwm_dir', help='Directory containing {motif}.txt PWM files.')
+    parser.add_argument('--manifest', help='Manifest path (default: next to the PWM directory).')
+    parser.add_argument('--rescan', action='store_true',
+                        help='Rescan even if the directory mtime is unchanged (e.g. after rewriting files in place).')
+    args = parser.parse_args()
+
+    manifest = MotifManifest(args.pwm_dir, args.manifest, args.rescan)
+    print(f"{len(manifest)} motifs in {args.pwm_dir}")
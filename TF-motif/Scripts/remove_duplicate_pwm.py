@@ -9,8 +9,30 @@
 """
 
 import os
+import hashlib
 import argparse
-from scipy.stats import pearsonr
+import numpy as np
+from scipy import sparse
+from motif_library import MotifLibrary
+from motif_manifest import MotifManifest
+
+
+def normalize_positions(pwm):
+    """
+    将PWM每个位置（行）中心化并缩放为单位长度，两行之间的点积即为皮尔逊相关系数
+
+    :param pwm: PWM矩阵，格式为嵌套列表或二维数组
+    :type pwm: list[list[float]]
+    :return: 标准化后的矩阵，方差为0的行全部为nan（与pearsonr返回nan一致）
+    :rtype: numpy.ndarray
+    """
+    arr = np.array(pwm, dtype=np.float64, ndmin=2)
+    arr -= arr.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', arr, arr))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        arr /= norms[:, None]
+    arr[norms == 0] = np.nan
+    return arr
 
 
 def pwm_similarity(pwm1, pwm2):
@@ -27,13 +49,223 @@ def pwm_similarity(pwm1, pwm2):
     if len(pwm1) != len(pwm2):  # 两个PWM矩阵的长度不同，返回0
         return 0
     n = len(pwm1)
-    corr_sum = 0
-    for i in range(n):
-        corr, _ = pearsonr(pwm1[i], pwm2[i])
-        corr_sum += corr
+    # 各位置皮尔逊相关系数之和等于两个标准化矩阵的逐元素乘积之和
+    corr_sum = np.einsum('ij,ij->', normalize_positions(pwm1), normalize_positions(pwm2))
     return corr_sum / n
 
 
+class PWMSimilarityMatrix:
+    """
+    一组PWM两两之间的相似性，结果与pwm_similarity逐对计算相同
+
+    PWM按长度分组，每组堆叠为(个数, 长度*4)的标准化数组，组内全部相似性由一次矩阵乘法得到并缓存；
+    不同长度之间的相似性为0，不占用内存。
+    """
+
+    def __init__(self, pwm_list):
+        self.lengths = np.array([len(pwm) for pwm in pwm_list], dtype=np.int64)
+        self.pos_in_group = np.zeros(len(pwm_list), dtype=np.int64)
+        self.blocks = {}
+        groups = {}
+        for i, length in enumerate(self.lengths):
+            groups.setdefault(int(length), []).append(i)
+        for length, members in groups.items():
+            self.pos_in_group[members] = np.arange(len(members))
+            stacked = np.stack([normalize_positions(pwm_list[i]).ravel() for i in members])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.blocks[length] = stacked @ stacked.T / length
+
+    def score(self, i, j):
+        if self.lengths[i] != self.lengths[j]:
+            return 0
+        return self.blocks[int(self.lengths[i])][self.pos_in_group[i], self.pos_in_group[j]]
+
+    def submatrix(self, idx):
+        """下标idx对应PWM之间的相似性矩阵"""
+        idx = np.asarray(idx, dtype=np.int64)
+        sub = np.zeros((len(idx), len(idx)))
+        for length in np.unique(self.lengths[idx]):
+            members = np.nonzero(self.lengths[idx] == length)[0]
+            pos = self.pos_in_group[idx[members]]
+            sub[np.ix_(members, members)] = self.blocks[int(length)][np.ix_(pos, pos)]
+        return sub
+
+
+def reverse_complement(pwm):
+    """PWM的反向互补矩阵：位置倒序，列按A、C、G、T顺序互换为T、G、C、A"""
+    return np.array(pwm, dtype=np.float64, ndmin=2)[::-1, ::-1]
+
+
+def stack_positions(pwm_list, width=None):
+    """
+    将一组PWM标准化后补零堆叠为(个数, 最大长度, 4)的数组
+
+    方差为0的位置（nan）与补齐的位置一样置为0，在比对中贡献的相关系数为0。
+    """
+    width = width or max(len(pwm) for pwm in pwm_list)
+    stacked = np.zeros((len(pwm_list), width, 4))
+    for i, pwm in enumerate(pwm_list):
+        stacked[i, :len(pwm)] = np.nan_to_num(normalize_positions(pwm))
+    return stacked
+
+
+def sliding_scores(query, query_lengths, target, target_lengths, min_overlap):
+    """
+    无空位滑动比对：每对PWM在所有错位下重叠位置的平均皮尔逊相关系数，取最大值
+
+    每个错位将查询PWM平移到目标的坐标上，重叠位置相关系数之和即为两个展平数组的点积，
+    因此每个错位只需一次(查询数, 宽度*4) @ (宽度*4, 目标数)的矩阵乘法。
+    重叠长度不足min_overlap（或较短PWM的长度）的错位不参与比较。
+
+    :return: (得分矩阵, 最佳错位矩阵)，错位为目标起点对应的查询位置
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    n_query, query_width, _ = query.shape
+    n_target, target_width, _ = target.shape
+    target_flat = target.reshape(n_target, -1).T
+    query_lengths = np.asarray(query_lengths)[:, None]
+    target_lengths = np.asarray(target_lengths)[None, :]
+    required = np.minimum(min_overlap, np.minimum(query_lengths, target_lengths))
+    best = np.full((n_query, n_target), -np.inf)
+    best_offset = np.zeros((n_query, n_target), dtype=np.int64)
+    shifted = np.zeros((n_query, target_width, 4))
+    for offset in range(-(target_width - 1), query_width):
+        # 查询的第i个位置对齐目标的第i-offset个位置
+        overlap = np.minimum(query_lengths, target_lengths + offset) - max(0, offset)
+        valid = overlap >= required
+        if not valid.any():
+            continue
+        shifted[:] = 0
+        start, end = max(0, offset), min(query_width, target_width + offset)
+        shifted[:, start - offset:end - offset] = query[:, start:end]
+        total = shifted.reshape(n_query, -1) @ target_flat
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = np.where(valid, total / overlap, -np.inf)
+        better = score > best
+        best[better] = score[better]
+        best_offset[better] = offset
+    return best, best_offset
+
+
+class PWMAligner:
+    """
+    标准化并补零堆叠后的PWM库，计算任意PWM之间考虑错位和反向互补的比对得分
+
+    长度相同、错位为0时得分与pwm_similarity相同（不含方差为0的位置时）。
+    """
+
+    def __init__(self, pwm_list, min_overlap=6, reverse=True):
+        self.min_overlap = min_overlap
+        self.reverse = reverse
+        self.lengths = np.array([len(pwm) for pwm in pwm_list], dtype=np.int64)
+        width = int(self.lengths.max()) if len(pwm_list) else 1
+        self.positions = stack_positions(pwm_list, width) if len(pwm_list) else np.zeros((0, width, 4))
+        # 反向互补：补齐的0放在末尾，只对真实位置倒序
+        self.rc_positions = np.zeros_like(self.positions)
+        for i, length in enumerate(self.lengths):
+            self.rc_positions[i, :length] = self.positions[i, :length][::-1, ::-1]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def scores(self, rows, cols=None):
+        """rows中的PWM与cols（默认为全部）中PWM的比对得分"""
+        cols = np.arange(len(self.lengths)) if cols is None else np.asarray(cols)
+        best, _ = sliding_scores(self.positions[rows], self.lengths[rows],
+                                 self.positions[cols], self.lengths[cols], self.min_overlap)
+        if self.reverse:
+            rc_best, _ = sliding_scores(self.positions[rows], self.lengths[rows],
+                                        self.rc_positions[cols], self.lengths[cols], self.min_overlap)
+            best = np.maximum(best, rc_best)
+        return best
+
+    def pair_scores(self, first, second, block_mb=256):
+        """
+        只计算指定PWM对(first[k], second[k])的得分
+
+        按first分块，每块与其所有配对PWM的并集计算一次得分矩阵，再取出需要的元素。
+        """
+        first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+        result = np.zeros(len(first))
+        order = np.argsort(first, kind='stable')
+        rows, bounds = np.unique(first[order], return_index=True)
+        bounds = list(bounds) + [len(order)]
+        budget = block_mb * 2 ** 20 // (8 * 8)
+        start, cols = 0, set()
+        for k in range(len(rows)):
+            # 按查询PWM扩展块，直到查询数与目标数的乘积达到内存预算
+            cols.update(second[order[bounds[k]:bounds[k + 1]]].tolist())
+            if k + 1 < len(rows) and (k + 2 - start) * len(cols) <= budget:
+                continue
+            chunk = order[bounds[start]:bounds[k + 1]]
+            block_rows, block_cols = rows[start:k + 1], np.array(sorted(cols), dtype=np.int64)
+            block = self.scores(block_rows, block_cols)
+            result[chunk] = block[np.searchsorted(block_rows, first[chunk]), np.searchsorted(block_cols, second[chunk])]
+            start, cols = k + 1, set()
+        return result
+
+
+class PWMAlignmentMatrix(PWMAligner):
+    """
+    一组PWM两两之间考虑错位和反向互补的相似性，接口与PWMSimilarityMatrix相同
+
+    按块计算查询PWM与整个库的滑动相关系数，每块的中间数组约为block_mb。
+    """
+
+    def __init__(self, pwm_list, min_overlap=6, reverse=True, block_mb=256):
+        super().__init__(pwm_list, min_overlap, reverse)
+        block = max(1, int(block_mb * 2 ** 20 // (8 * 8 * max(1, len(pwm_list)))))
+        self.matrix = np.zeros((len(pwm_list), len(pwm_list)), dtype=np.float32)
+        for start in range(0, len(pwm_list), block):
+            self.matrix[start:start + block] = self.scores(np.arange(start, min(start + block, len(pwm_list))))
+
+    def score(self, i, j):
+        return self.matrix[i, j]
+
+    def submatrix(self, idx):
+        """下标idx对应PWM之间的相似性矩阵"""
+        return self.matrix[np.ix_(idx, idx)].astype(np.float64)
+
+
+def align_pwms(pwm1, pwm2, min_overlap=6, reverse=True):
+    """
+    两个PWM的最佳无空位比对
+
+    :return: (得分, PWM2相对PWM1的错位, PWM2的方向'+'或'-')
+    :rtype: tuple[float, int, str]
+    """
+    query = stack_positions([pwm1])
+    results = []
+    strands = [('+', pwm2)] + ([('-', reverse_complement(pwm2))] if reverse else [])
+    for strand, target in strands:
+        best, offset = sliding_scores(query, [len(pwm1)], stack_positions([target]), [len(pwm2)], min_overlap)
+        results.append((float(best[0, 0]), int(offset[0, 0]), strand))
+    return max(results, key=lambda x: x[0])
+
+
+def unique_pwm_indices(pwm_list, threshold=0.9, similarity=None):
+    """
+    贪心去重，返回保留的PWM下标；逐个检查PWM与已保留PWM的相似性，直接查询相似性矩阵
+
+    :param pwm_list: 待处理的PWM矩阵列表
+    :type pwm_list: list[list[list[float]]]
+    :param threshold: PWM相似性的阈值，默认值为0.9
+    :type threshold: float
+    :param similarity: 预先计算的相似性矩阵（下标与pwm_list对应），为None时现场计算
+    :type similarity: numpy.ndarray
+    :return: 保留的PWM下标
+    :rtype: list[int]
+    """
+    if similarity is None:
+        similarity = PWMSimilarityMatrix(pwm_list).submatrix(range(len(pwm_list)))
+    unique = []
+    for i in range(len(pwm_list)):
+        # nan与阈值比较为False，与逐对计算时的行为一致
+        if not np.any(similarity[i, unique] > threshold):
+            unique.append(i)
+    return unique
+
+
 def remove_duplicate_pwm(pwm_list, threshold=0.9):
     """
     从给定的PWM矩阵列表中删除相似的PWM矩阵
@@ -45,16 +277,7 @@ def remove_duplicate_pwm(pwm_list, threshold=0.9):
     :return: 删除重复后的PWM矩阵列表
     :rtype: list[list[float]]
     """
-    unique_pwms = []
-    for i, pwm1 in enumerate(pwm_list):
-        is_duplicate = False
-        for pwm2 in unique_pwms:
-            if pwm_similarity(pwm1, pwm2) > threshold:
-                is_duplicate = True
-                break
-        if not is_duplicate:
-            unique_pwms.append(pwm1)
-    return unique_pwms
+    return [pwm_list[i] for i in unique_pwm_indices(pwm_list, threshold)]
 
 
 def load_motif(motif_file):
@@ -76,6 +299,148 @@ def load_motif(motif_file):
     return pwm
 
 
+def kmer_ids(pwm, k):
+    """PWM一致序列（每个位置取最大值的碱基）及其反向互补中所有k-mer的编号"""
+    codes = np.argmax(np.array(pwm, dtype=np.float64, ndmin=2), axis=1)
+    ids = []
+    for strand in (codes, 3 - codes[::-1]):
+        windows = np.lib.stride_tricks.sliding_window_view(strand, k)
+        ids.append(windows @ (4 ** np.arange(k - 1, -1, -1)))
+    return np.unique(np.concatenate(ids))
+
+
+def candidate_pairs(pwm_list, k=6, min_shared=1):
+    """
+    预筛选：一致序列（含反向互补）共享至少min_shared个k-mer的PWM对才计算比对得分
+
+    k-mer倒排索引用稀疏矩阵表示（PWM × k-mer），共享个数即为其与自身转置的乘积，
+    只有共享k-mer的PWM对会出现在结果中，候选对数不随PWM数平方增长。长度小于k的PWM与所有PWM配对，
+    k <= 0时不做预筛选，返回所有PWM对。
+
+    :return: 候选PWM对的下标(first, second)，first < second
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    if k <= 0:
+        return np.triu_indices(len(pwm_list), 1)
+    rows, cols = [], []
+    short = []
+    for i, pwm in enumerate(pwm_list):
+        if len(pwm) < k:
+            short.append(i)
+            continue
+        ids = kmer_ids(pwm, k)
+        rows.append(np.full(len(ids), i))
+        cols.append(ids)
+    n = len(pwm_list)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    index = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(n, 4 ** k))
+    shared = sparse.triu(index @ index.T, k=1).tocoo()
+    keep = shared.data >= min_shared
+    # 每对PWM编码为first * n + second，用NumPy数组合并、去重并排序
+    codes = [shared.row[keep].astype(np.int64) * n + shared.col[keep]]
+    others = np.arange(n, dtype=np.int64)
+    for i in short:
+        pair_with = others[others != i]
+        codes.append(np.minimum(i, pair_with) * n + np.maximum(i, pair_with))
+    codes = np.unique(np.concatenate(codes))
+    return codes // n, codes % n
+
+
+def score_cache_key(names, pwm_list, min_overlap, reverse, k, min_shared):
+    """得分缓存的校验值：motif名称、PWM内容以及比对和预筛选参数都相同时缓存才可复用"""
+    digest = hashlib.sha1(f"{min_overlap}\t{reverse}\t{k}\t{min_shared}".encode())
+    for name, pwm in zip(names, pwm_list):
+        digest.update(name.encode() + b'\n')
+        digest.update(np.array(pwm, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def cached_pair_scores(names, pwm_list, cache_file, min_overlap=6, reverse=True, k=6, min_shared=1, block_mb=256):
+    """
+    读取或计算所有候选PWM对的比对得分
+
+    得分与阈值无关，保存在cache_file（npz）中，以不同阈值重复聚类时直接复用。
+
+    :return: (first, second, score)
+    :rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    """
+    key = score_cache_key(names, pwm_list, min_overlap, reverse, k, min_shared)
+    if cache_file and os.path.exists(cache_file):
+        with np.load(cache_file) as cache:
+            if str(cache['key']) == key:
+                print(f"Reusing {len(cache['score'])} cached pair scores from {cache_file}")
+                return cache['first'], cache['second'], cache['score']
+    first, second = candidate_pairs(pwm_list, k, min_shared)
+    total = len(pwm_list) * (len(pwm_list) - 1) // 2
+    print(f"{len(first)} of {total} PWM pairs to align")
+    score = PWMAligner(pwm_list, min_overlap, reverse).pair_scores(first, second, block_mb).astype(np.float32)
+    if cache_file:
+        with open(cache_file + '.tmp', 'wb') as f:
+            np.savez(f, key=key, first=first, second=second, score=score)
+        os.replace(cache_file + '.tmp', cache_file)
+    return first, second, score
+
+
+def greedy_clusters(n, first, second, score, threshold=0.9):
+    """
+    贪心聚类：按顺序遍历PWM，尚未归类的PWM成为代表，与其相似性大于阈值且尚未归类的PWM归入该类
+
+    :return: (每个PWM的代表下标, 与代表的相似性)
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    passed = score > threshold
+    graph = sparse.coo_matrix((score[passed], (first[passed], second[passed])), shape=(n, n)).tocsr()
+    graph = (graph + graph.T).tocsr()
+    representative = np.full(n, -1, dtype=np.int64)
+    rep_score = np.zeros(n)
+    for i in range(n):
+        if representative[i] >= 0:
+            continue
+        representative[i], rep_score[i] = i, 1.0
+        neighbors = graph.indices[graph.indptr[i]:graph.indptr[i + 1]]
+        scores = graph.data[graph.indptr[i]:graph.indptr[i + 1]]
+        free = representative[neighbors] < 0
+        representative[neighbors[free]] = i
+        rep_score[neighbors[free]] = scores[free]
+    return representative, rep_score
+
+
+def write_clusters(cluster_file, names, representative, rep_score):
+    """保存聚类结果：motif、类编号、代表motif、与代表的相似性"""
+    cluster_ids = {rep: k + 1 for k, rep in enumerate(dict.fromkeys(representative.tolist()))}
+    with open(cluster_file, "w") as f:
+        f.write("motif\tcluster\trepresentative\tscore\n")
+        for name, rep, score in zip(names, representative, rep_score):
+            f.write(f"{name}\t{cluster_ids[rep]}\t{names[rep]}\t{score:.4f}\n")
+    return len(cluster_ids)
+
+
+def cluster_library(args, lines, library):
+    """
+    全库聚类模式：所有motif只比对、聚类一次，TF对应的motif替换为其所在类的代表并去重
+
+    :return: 输出文件内容
+    :rtype: list[str]
+    """
+    names = list(library)
+    pwm_list = [library[name] for name in names]
+    first, second, score = cached_pair_scores(names, pwm_list, args.score_cache, args.min_overlap, not args.no_rc,
+                                              args.kmer, args.min_shared, args.block_mb)
+    representative, rep_score = greedy_clusters(len(names), first, second, score, args.threshold)
+    n_clusters = write_clusters(args.clusters, names, representative, rep_score)
+    print(f"{len(names)} motifs grouped into {n_clusters} clusters, saved to {args.clusters}")
+
+    rep_names = {name: names[rep] for name, rep in zip(names, representative)}
+    content = []
+    for tf_name, motif_name_str in lines:
+        motif_names = [rep_names[motif] for motif in motif_name_str.split(",") if motif in rep_names]
+        if not motif_names:
+            continue
+        content.append(tf_name + "\t" + ",".join(dict.fromkeys(motif_names)) + "\n")
+    return content
+
+
 def main(args):
     """
     主函数
@@ -84,48 +449,100 @@ def main(args):
     :type args: argparse.Namespace
     """
     with open(args.infile, "r") as f:
-        content = []
-        for line in f:
-            tf_name, motif_name_str = line.strip().split("\t")
-            motif_names = motif_name_str.split(",")
-            # 删除不存在的PWM文件
-            motif_names = [motif for motif in motif_names if os.path.exists(os.path.join(args.dir, motif + ".txt"))]
-
-            # 如果motif_names为空，则跳过该行
-            if not motif_names:
+        lines = [line.strip().split("\t") for line in f if line.strip()]
+
+    # 每个motif只加载一次，并一次性计算所有motif两两之间的相似性
+    library = {}
+    motif_library = MotifLibrary(args.library) if args.library else None
+    # 目录中可用的motif由清单判断，不再对每个motif调用os.path.exists
+    manifest = MotifManifest(args.dir, args.manifest, args.rescan) if motif_library is None else None
+    for tf_name, motif_name_str in lines:
+        for motif in motif_name_str.split(","):
+            if motif in library:
                 continue
+            if motif_library is not None:
+                if motif in motif_library:
+                    library[motif] = motif_library.pwm(motif)
+            elif motif in manifest:
+                library[motif] = load_motif(manifest.motif_path(motif))
+    if args.cluster:
+        content = cluster_library(args, lines, library)
+        with open(args.outfile, "w") as f:
+            f.writelines(content)
+        return
 
-            # 加载PWM矩阵
-            pwms = [load_motif(os.path.join(args.dir, motif_name + ".txt")) for motif_name in motif_names]
+    library_index = {motif: i for i, motif in enumerate(library)}
+    if args.align:
+        similarity = PWMAlignmentMatrix(list(library.values()), args.min_overlap, not args.no_rc, args.block_mb)
+    else:
+        similarity = PWMSimilarityMatrix(list(library.values()))
 
-            # 删除相似的PWM矩阵
-            unique_pwms = remove_duplicate_pwm(pwms, threshold=args.threshold)
+    content = []
+    for tf_name, motif_name_str in lines:
+        motif_names = motif_name_str.split(",")
+        # 删除不存在的PWM文件
+        motif_names = [motif for motif in motif_names if motif in library]
 
-            # 获取相应的唯一motif名称
-            unique_motif_names = [motif_names[i] for i, pwm in enumerate(pwms) if pwm in unique_pwms]
+        # 如果motif_names为空，则跳过该行
+        if not motif_names:
+            continue
 
-            # 将TF和唯一motif名称写入输出文件中
-            content.append(tf_name + "\t" + ",".join(unique_motif_names) + "\n")
+        # 加载PWM矩阵
+        pwms = [library[motif_name] for motif_name in motif_names]
 
-        # 将输出内容写入输出文件中
-        with open(args.outfile, "w") as f:
-            f.writelines(content)
+        # 删除相似的PWM矩阵，相似性直接从缓存中查询
+        sub = similarity.submatrix([library_index[motif_name] for motif_name in motif_names])
+        unique_pwms = [pwms[i] for i in unique_pwm_indices(pwms, args.threshold, sub)]
+
+        # 获取相应的唯一motif名称
+        unique_motif_names = [motif_names[i] for i, pwm in enumerate(pwms) if pwm in unique_pwms]
+
+        # 将TF和唯一motif名称写入输出文件中
+        content.append(tf_name + "\t" + ",".join(unique_motif_names) + "\n")
+
+    # 将输出内容写入输出文件中
+    with open(args.outfile, "w") as f:
+        f.writelines(content)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove duplicate PWMs from input file.")
     parser.add_argument("infile", help="Input file containing TF names and motif names.")
-    parser.add_argument("dir", help="Directory containing PWM files.")
+    parser.add_argument("dir", nargs="?", help="Directory containing PWM files.")
+    parser.add_argument("--library", help="Binary motif library (motif_library.py) used instead of dir.")
+    parser.add_argument("--manifest", help="Manifest of dir (default: next to dir, see motif_manifest.py).")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Rescan dir even if its mtime is unchanged (e.g. after rewriting PWM files in place).")
     parser.add_argument("--threshold", type=float, default=0.9, help="PWM similarity threshold.")
     parser.add_argument("--outfile", "-o", help="Output file to store the unique TF-motif pairs.",
                         default="TF2motif_unique.txt")
+    parser.add_argument("--align", action="store_true",
+                        help="Compare PWMs with ungapped offset alignment (and reverse complement), "
+                             "so PWMs of different lengths can be duplicates.")
+    parser.add_argument("--min_overlap", type=int, default=6,
+                        help="Minimum aligned positions with --align (shorter PWMs need full overlap).")
+    parser.add_argument("--no_rc", action="store_true", help="Do not compare reverse complements with --align.")
+    parser.add_argument("--block_mb", type=int, default=256,
+                        help="Memory for one block of sliding correlations with --align or --cluster (MB).")
+    parser.add_argument("--cluster", action="store_true",
+                        help="Cluster all motifs of the library once with the --align score and replace every "
+                             "motif by its cluster representative, instead of deduplicating each TF separately.")
+    parser.add_argument("--clusters", default="motif_clusters.tsv", help="Cluster assignments written by --cluster.")
+    parser.add_argument("--score_cache", default="motif_pair_scores.npz",
+                        help="Pairwise scores cached by --cluster and reused at other thresholds ('' to disable).")
+    parser.add_argument("--kmer", type=int, default=6,
+                        help="k-mer length of the consensus prefilter used by --cluster (0 aligns all pairs).")
+    parser.add_argument("--min_shared", type=int, default=1,
+                        help="Consensus k-mers two motifs must share to be aligned by --cluster.")
     args = parser.parse_args()
+    if not args.dir and not args.library:
+        parser.error("either dir or --library is required")
 
     # 输出程序开始运行信息
     print("=" * 40)
     print("Starting program...")
     print(f"Input file: {args.infile}")
-    print(f"PWM directory: {args.dir}")
+    print(f"PWM directory: {args.dir}" if not args.library else f"Motif library: {args.library}")
     print(f"PWM similarity threshold: {args.threshold}")
     print(f"Output file: {args.outfile}")
     print("=" * 40)
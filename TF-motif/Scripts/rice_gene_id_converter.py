@@ -7,7 +7,29 @@
 @filename : rice_gene_id_converter.py
 """
 
+import os
+import pickle
 import argparse
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+
+"""
+python rice_gene_id_converter.py rap2msu --map_file RAP-MSU.txt --input_file gid.txt
+python rice_gene_id_converter.py msu2rap --table grn.tsv --columns TF TG --multi explode --missing drop -p 8 -o grn_rap.tsv
+
+对应关系第一次使用时编译为{map_file}.pkl，记录RAP-MSU.txt的修改时间和大小，源文件变化时自动重新编译。
+其他脚本可以通过IDConverter.from_file(map_file, 'rap2msu')对整列基因ID做一次性的向量化转换。
+
+--table模式按块流式读取任意分隔符的表格，只转换--columns指定的列，其余列原样输出，多进程处理时保持原有行顺序：
+    --multi    一个ID对应多个ID时：explode每个对应ID一行，join以逗号连接（默认），drop去掉该行
+    --missing  没有对应ID时：none写为None（默认，与逐行模式相同），keep保留原ID，drop去掉该行
+没有表头时（--no_header）用从0开始的列号指定列。
+"""
+
+CACHE_SUFFIX = '.pkl'
+CACHE_VERSION = 1
 
 
 def get_args():
@@ -15,8 +37,22 @@ def get_args():
     parser = argparse.ArgumentParser(description='Convert between rice reference genome RAP gene IDs and MSU gene IDs.')
     parser.add_argument("type", choices=["rap2msu", "msu2rap"], help='The type of ID to convert (RAP to MSU or MSU to RAP)')
     parser.add_argument("--map_file", default='RAP-MSU.txt', type=str, help='The file containing the ID mapping information')
-    parser.add_argument("--input_file", required=True, type=str, help='The file containing the input gene IDs')
-    return parser.parse_args()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--input_file", type=str, help='The file containing the input gene IDs')
+    group.add_argument("--table", type=str, help='A delimited table whose --columns are translated in place')
+    parser.add_argument("--no_cache", action="store_true", help='Parse the mapping file instead of using its compiled cache')
+    parser.add_argument("--columns", nargs='+', default=None, help='Columns of --table to translate (0-based numbers with --no_header)')
+    parser.add_argument("--sep", default='\t', type=str, help='Field separator of --table (default: tab)')
+    parser.add_argument("--no_header", action="store_true", help='--table has no header line')
+    parser.add_argument("--multi", choices=["explode", "join", "drop"], default="join", help='Policy for IDs with several targets')
+    parser.add_argument("--missing", choices=["none", "keep", "drop"], default="none", help='Policy for IDs without a target')
+    parser.add_argument("--chunksize", default=1000000, type=int, help='Rows of --table translated per chunk')
+    parser.add_argument("--processes", "-p", default=1, type=int, help='Number of chunks translated in parallel')
+    parser.add_argument("--output", "-o", type=str, default=None, help='Output table (default: {table}.{type}{ext})')
+    args = parser.parse_args()
+    if args.table and not args.columns:
+        parser.error("--table needs --columns")
+    return args
 
 
 def map_dict(map_file):
@@ -25,32 +61,96 @@ def map_dict(map_file):
     relation_msu2rap = {}
     with open(map_file) as f:
         for line in f:
+            if not line.strip():
+                continue
             rap, msu = line.strip().split("\t")
-            msu_gene_list = []
-            if "," in msu:
-                for transcript in msu.split(","):
-                    gene_id = transcript.split(".")[0]
-                    if gene_id not in msu_gene_list:
-                        msu_gene_list.append(gene_id)
-            if ("," not in msu) and (msu != "None"):
-                msu_gene_list.append(msu.split(".")[0])
             if msu == "None":
-                msu_gene_list.append(msu)
+                msu_gene_list = [msu]
+            else:
+                # 转录本ID去掉后缀得到基因ID，按出现顺序去重
+                msu_gene_list = list(dict.fromkeys(transcript.split(".")[0] for transcript in msu.split(",")))
 
             # rap2msu字典
             relation_rap2msu[rap] = msu_gene_list
 
-            # msu2rap字典
+            # msu2rap字典，用字典保存RAP ID以便按插入顺序去重
             for msu_gene in msu_gene_list:
-                if msu_gene not in relation_msu2rap.keys():
-                    relation_msu2rap[msu_gene] = []
-                    relation_msu2rap[msu_gene].append(rap)
-                if msu_gene in relation_msu2rap.keys():
-                    if rap not in relation_msu2rap[msu_gene]:
-                        relation_msu2rap[msu_gene].append(rap)
+                relation_msu2rap.setdefault(msu_gene, {})[rap] = None
+    relation_msu2rap = {msu_gene: list(raps) for msu_gene, raps in relation_msu2rap.items()}
     return relation_rap2msu, relation_msu2rap
 
 
+def load_mapping(map_file, use_cache=True):
+    """
+    读取对应关系，优先使用编译好的{map_file}.pkl缓存，源文件的修改时间或大小变化时重新编译
+
+    :return: (rap2msu字典, msu2rap字典)
+    :rtype: tuple[dict, dict]
+    """
+    if not use_cache:
+        return map_dict(map_file)
+    stat = os.stat(map_file)
+    stamp = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    cache_file = map_file + CACHE_SUFFIX
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['stamp'] == stamp:
+                return cached['rap2msu'], cached['msu2rap']
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+            pass
+    relation_rap2msu, relation_msu2rap = map_dict(map_file)
+    try:
+        with open(cache_file + '.tmp', 'wb') as f:
+            pickle.dump({'stamp': stamp, 'rap2msu': relation_rap2msu, 'msu2rap': relation_msu2rap}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+    except OSError as e:
+        print(f"Cannot save mapping cache {cache_file}: {e}")
+    return relation_rap2msu, relation_msu2rap
+
+
+class IDConverter:
+    """
+    向量化的基因ID转换：对应关系的键保存为pd.Index，整列ID通过一次get_indexer查找完成转换
+    """
+
+    def __init__(self, relation_dict):
+        self.index = pd.Index(list(relation_dict))
+        self.targets = list(relation_dict.values())
+        # 最后一个元素对应get_indexer返回的-1（ID不存在）
+        self.joined = np.array([','.join(x) for x in self.targets] + [None], dtype=object)
+
+    @classmethod
+    def from_file(cls, map_file, direction="rap2msu", use_cache=True):
+        relation_rap2msu, relation_msu2rap = load_mapping(map_file, use_cache)
+        return cls(relation_rap2msu if direction == "rap2msu" else relation_msu2rap)
+
+    def positions(self, gene_ids):
+        """每个ID在对应关系中的位置，不存在时为-1"""
+        return self.index.get_indexer(pd.Index(np.asarray(gene_ids, dtype=object)))
+
+    def convert(self, gene_ids, missing="None"):
+        """
+        转换一列基因ID，一对多时以逗号连接，与convertor的结果相同
+
+        :param gene_ids: 基因ID序列（list、numpy数组或pandas Series）
+        :param missing: 不存在的ID的转换结果
+        :return: 转换后的ID数组
+        :rtype: numpy.ndarray
+        """
+        positions = self.positions(gene_ids)
+        result = self.joined[positions]
+        if missing is not None:
+            result[positions < 0] = missing
+        return result
+
+    def convert_lists(self, gene_ids):
+        """转换一列基因ID，每个ID返回对应ID的列表，不存在时为None"""
+        return [self.targets[pos] if pos >= 0 else None for pos in self.positions(gene_ids)]
+
+
 def convertor(gene_id, relation_dict):
     """根据提供的字典关系将基因ID转换为对应类型"""
     if gene_id in relation_dict:
@@ -60,16 +160,108 @@ def convertor(gene_id, relation_dict):
         return "None"
 
 
+def translate_chunk(df, columns, converter, multi="join", missing="none"):
+    """
+    按对应关系转换表格中的指定列，其余列不变
+
+    :param df: 一个数据块，所有列均为字符串
+    :param columns: 需要转换的列
+    :param converter: IDConverter
+    :param multi: 一对多时的处理方式：explode、join或drop
+    :param missing: 没有对应ID时的处理方式：none、keep或drop
+    :return: 转换后的数据块
+    :rtype: pandas.DataFrame
+    """
+    for column in columns:
+        ids = df[column].to_numpy(dtype=object)
+        targets = converter.convert_lists(ids)
+        # RAP-MSU.txt中对应为None的ID与不存在的ID一样视为没有对应ID
+        found = np.array([t is not None and t != ["None"] for t in targets], dtype=bool)
+        if missing == "keep":
+            targets = [t if ok else [gene_id] for t, ok, gene_id in zip(targets, found, ids)]
+        elif missing == "none":
+            targets = [t if ok else ["None"] for t, ok in zip(targets, found)]
+        keep = found if missing == "drop" else np.ones(len(df), dtype=bool)
+        if multi == "drop":
+            keep &= np.array([t is None or len(t) == 1 for t in targets], dtype=bool)
+        if not keep.all():
+            df = df[keep]
+            targets = [t for t, k in zip(targets, keep) if k]
+        df = df.copy()
+        if multi == "explode":
+            df[column] = pd.Series(targets, index=df.index, dtype=object)
+            df = df.explode(column)
+        else:
+            df[column] = [",".join(t) for t in targets]
+    return df
+
+
+_worker_state = {}
+
+
+def init_worker(map_file, direction, use_cache, columns, sep, multi, missing):
+    # 每个进程从编译好的缓存读取一次对应关系
+    _worker_state['converter'] = IDConverter.from_file(map_file, direction, use_cache)
+    _worker_state['options'] = (columns, sep, multi, missing)
+
+
+def translate_text(task):
+    # 在进程中转换一个数据块并返回输出文本，主进程只负责按顺序写出
+    df, header = task
+    columns, sep, multi, missing = _worker_state['options']
+    df = translate_chunk(df, columns, _worker_state['converter'], multi, missing)
+    return df.to_csv(sep=sep, header=header, index=False), len(df)
+
+
+def translate_table(args):
+    """按块流式转换--table中的指定列，多进程时按提交顺序写出结果以保持行顺序
+
+    同时在进程池中的数据块最多为进程数的2倍，读取速度受写出速度限制，内存占用与表格大小无关。
+    """
+    if args.output is None:
+        root, ext = os.path.splitext(args.table)
+        args.output = f"{root}.{args.type}{ext}"
+    columns = [int(c) for c in args.columns] if args.no_header else args.columns
+    reader = pd.read_csv(args.table, sep=args.sep, header=None if args.no_header else 0, dtype=str,
+                         keep_default_na=False, na_filter=False, chunksize=args.chunksize)
+    tasks = ((df, not args.no_header and i == 0) for i, df in enumerate(reader))
+    initargs = (args.map_file, args.type, not args.no_cache, columns, args.sep, args.multi, args.missing)
+    # 在主进程中编译一次对应关系，各进程直接读取缓存
+    load_mapping(args.map_file, not args.no_cache)
+    n_rows = 0
+    with open(args.output, "w") as out:
+        if args.processes > 1:
+            with Pool(processes=args.processes, initializer=init_worker, initargs=initargs) as pool:
+                pending = deque()
+                for task in tasks:
+                    if len(pending) >= 2 * args.processes:
+                        text, n = pending.popleft().get()
+                        out.write(text)
+                        n_rows += n
+                    pending.append(pool.apply_async(translate_text, (task,)))
+                while pending:
+                    text, n = pending.popleft().get()
+                    out.write(text)
+                    n_rows += n
+        else:
+            init_worker(*initargs)
+            for task in tasks:
+                text, n = translate_text(task)
+                out.write(text)
+                n_rows += n
+    print(f"{n_rows} rows saved to {args.output}")
+
+
 def main():
     args = get_args()
-    content = []
-    relation_rap2msu, relation_msu2rap = map_dict(args.map_file)
-    relation_dict = relation_rap2msu if args.type == "rap2msu" else relation_msu2rap
+    if args.table:
+        translate_table(args)
+        return
+    converter = IDConverter.from_file(args.map_file, args.type, use_cache=not args.no_cache)
     with open(args.input_file) as f:
-        for gene_id in f:
-            gene_id = gene_id.strip()
-            gene_id_list = convertor(gene_id, relation_dict)
-            content.append(gene_id + "\t" + gene_id_list + "\n")
+        gene_ids = [gene_id.strip() for gene_id in f]
+    converted = converter.convert(gene_ids)
+    content = [gene_id + "\t" + gene_id_list + "\n" for gene_id, gene_id_list in zip(gene_ids, converted)]
 
     with open(f"gid_{args.type}.txt", "w") as res:
         res.writelines(content)